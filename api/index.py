@@ -1,22 +1,30 @@
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form, APIRouter
+import time
+
+IMPORT_STARTED = time.perf_counter()  # see STARTUP_REPORT
+
+from fastapi import FastAPI, Depends, HTTPException, status, APIRouter, Request, Response
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import base64
+import threading
 import hashlib
 from jose import JWTError, jwt
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from typing import Optional, List
 import sqlite3
 import os
 import json
-import httpx
 from pydantic import BaseModel, EmailStr
 import logging
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from twilio.rest import Client
+import sys
+
+# The streaming upload helpers live with the backend and are shared by both apps
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from streaming_upload import UploadSizeLimitMiddleware, discard_staged_file, stage_multipart_upload
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -35,6 +43,7 @@ async def send_error_notification(error_details: str):
     try:
         # Send SMS notification
         if TWILIO_SID and TWILIO_AUTH_TOKEN and TWILIO_PHONE:
+            from twilio.rest import Client  # slow to import, and rarely needed
             client = Client(TWILIO_SID, TWILIO_AUTH_TOKEN)
             message = client.messages.create(
                 body=f"Sai Kalpataru App Error: {error_details[:100]}...",
@@ -52,6 +61,18 @@ async def send_error_notification(error_details: str):
 
 # Database path
 DATABASE_PATH = "sai_kalpataru.db"
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "4"))
+DB_EXECUTOR_QUEUE_DEPTH = int(os.getenv("DB_EXECUTOR_QUEUE_DEPTH", "64"))
+
+# Uploads
+UPLOAD_DIR = "uploads"
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(200 * 1024 * 1024)))
+MULTIPART_OVERHEAD_BYTES = 64 * 1024  # boundaries and the small form fields around the file
+
+# Pagination
+PAGE_DEFAULT_LIMIT = int(os.getenv("PAGE_DEFAULT_LIMIT", "100"))
+PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", "1000"))
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
 
 # Secret key for JWT - in production, use environment variable
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here-change-in-production")
@@ -64,6 +85,12 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 # FastAPI app
 app = FastAPI(title="Sai Kalpataru API", version="1.0.0")
 
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    paths=["/api/upload"],
+    max_bytes=MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES,
+)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -71,14 +98,101 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 # API Router
 api_router = APIRouter(prefix="/api")
 
-# Database initialization
+# Async database access: blocking sqlite3 work runs on a dedicated executor,
+# and each executor thread keeps one long-lived connection.
+_db_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+_db_slots = threading.BoundedSemaphore(DB_EXECUTOR_WORKERS + DB_EXECUTOR_QUEUE_DEPTH)
+_db_local = threading.local()
+
+def _thread_connection():
+    conn = getattr(_db_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DATABASE_PATH)
+        _db_local.conn = conn
+    return conn
+
+def _run_with_connection(fn, args):
+    conn = _thread_connection()
+    try:
+        return fn(conn, *args)
+    finally:
+        # Never leave a transaction open on the shared thread connection
+        if conn.in_transaction:
+            conn.rollback()
+
+async def run_db(fn, *args):
+    """Run ``fn(conn, *args)`` on the database executor and await the result."""
+    if not _db_slots.acquire(blocking=False):
+        raise HTTPException(status_code=503, detail="Server is busy, please retry")
+    try:
+        future = _db_executor.submit(_run_with_connection, fn, args)
+    except BaseException:
+        _db_slots.release()
+        raise
+    future.add_done_callback(lambda _: _db_slots.release())
+    return await asyncio.wrap_future(future)
+
+# Keyset pagination: a page is ordered by a unique sort key and the key of
+# its last row is returned as an opaque cursor in the X-Next-Cursor header;
+# the next page seeks past that key through an index instead of using OFFSET.
+def encode_cursor(key: list) -> str:
+    raw = json.dumps(key, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, size: int) -> list:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        key = None
+    if not isinstance(key, list) or len(key) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return key
+
+def check_page_limit(limit: Optional[int], cursor: Optional[str]) -> Optional[int]:
+    """The page size for a listing, or None for the whole listing.
+
+    Callers that send neither ``limit`` nor ``cursor`` get every row, as
+    before the listings were paginated; a cursor alone pages at
+    PAGE_DEFAULT_LIMIT.
+    """
+    if limit is None:
+        return PAGE_DEFAULT_LIMIT if cursor else None
+    if not 1 <= limit <= PAGE_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {PAGE_MAX_LIMIT}")
+    return limit
+
+def parse_fields(fields: Optional[str], allowed: List[str]) -> List[str]:
+    if not fields:
+        return list(allowed)
+    selected = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in selected if name not in allowed]
+    if unknown or not selected:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}; expected some of: {', '.join(allowed)}"
+        )
+    return selected
+
+def like_prefix(prefix: str) -> str:
+    escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "%"
+
+# Database initialization. Bump SCHEMA_VERSION whenever the DDL below
+# changes; a database already at that version skips it entirely, which keeps
+# cold starts down to a single PRAGMA read.
+SCHEMA_VERSION = 1
+
 def init_db():
     conn = sqlite3.connect(DATABASE_PATH)
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        conn.close()
+        return
     cursor = conn.cursor()
     
     # Create users table
@@ -131,11 +245,52 @@ def init_db():
         )
     ''')
     
+    # Indexes backing the keyset-paginated listings
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_users_by_name ON users (first_name, last_name, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_student_courses_assigned ON student_courses (assigned_at, id)")
+    
+    # Create practice_buckets table: finished sessions summed per day and
+    # per week (Monday start, UTC), backfilled from history when first created
+    backfill = not cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'practice_buckets'"
+    ).fetchone()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS practice_buckets (
+            user_id INTEGER NOT NULL,
+            granularity TEXT NOT NULL,
+            bucket_start DATE NOT NULL,
+            course_id INTEGER NOT NULL,
+            total_minutes INTEGER NOT NULL DEFAULT 0,
+            session_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, granularity, bucket_start, course_id)
+        ) WITHOUT ROWID
+    ''')
+    if backfill:
+        for granularity, bucket_expression in PRACTICE_BUCKET_EXPRESSIONS.items():
+            cursor.execute(f'''
+                INSERT INTO practice_buckets (user_id, granularity, bucket_start, course_id, total_minutes, session_count)
+                SELECT user_id, ?, {bucket_expression}, course_id, SUM(duration_minutes), COUNT(id)
+                FROM time_tracking
+                WHERE session_end IS NOT NULL
+                GROUP BY 1, 3, 4
+            ''', (granularity,))
+    
+    cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
     conn.commit()
     conn.close()
 
+# Practice bucket start for a session, keyed by its start time
+PRACTICE_BUCKET_EXPRESSIONS = {
+    "day": "date(session_start)",
+    "week": "date(session_start, '-6 days', 'weekday 1')",
+}
+PRACTICE_RANGE_LIMITS = {"day": 366, "week": 104}
+PRACTICE_DEFAULT_RANGE = {"day": 30, "week": 12}
+
 # Initialize database
+_init_started = time.perf_counter()
 init_db()
+_init_seconds = time.perf_counter() - _init_started
 
 # Pydantic models
 class UserCreate(BaseModel):
@@ -210,11 +365,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise credentials_exception
     
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE email = ?", (token_data.email,))
-    user = cursor.fetchone()
-    conn.close()
+    user = await run_db(_fetch_user_by_email, token_data.email)
     
     if user is None:
         raise credentials_exception
@@ -227,26 +378,32 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         role=user[5]
     )
 
+def _fetch_user_by_email(conn, email: str):
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM users WHERE email = ?", (email,))
+    return cursor.fetchone()
+
 # Authentication endpoints
 @api_router.post("/register", response_model=dict)
 async def register(user: UserCreate):
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        
-        # Check if user already exists
-        cursor.execute("SELECT email FROM users WHERE email = ?", (user.email,))
-        if cursor.fetchone():
-            raise HTTPException(status_code=400, detail="Email already registered")
-        
-        # Create new user
-        hashed_password = hash_password(user.password)
-        cursor.execute(
-            "INSERT INTO users (email, first_name, last_name, password_hash, role) VALUES (?, ?, ?, ?, ?)",
-            (user.email, user.first_name, user.last_name, hashed_password, user.role)
-        )
-        conn.commit()
-        conn.close()
+        def create_user(conn):
+            cursor = conn.cursor()
+            
+            # Check if user already exists
+            cursor.execute("SELECT email FROM users WHERE email = ?", (user.email,))
+            if cursor.fetchone():
+                raise HTTPException(status_code=400, detail="Email already registered")
+            
+            # Create new user
+            hashed_password = hash_password(user.password)
+            cursor.execute(
+                "INSERT INTO users (email, first_name, last_name, password_hash, role) VALUES (?, ?, ?, ?, ?)",
+                (user.email, user.first_name, user.last_name, hashed_password, user.role)
+            )
+            conn.commit()
+        
+        await run_db(create_user)
         
         return {"message": "User registered successfully"}
     
@@ -260,11 +417,7 @@ async def register(user: UserCreate):
 @api_router.post("/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM users WHERE email = ?", (form_data.username,))
-        user = cursor.fetchone()
-        conn.close()
+        user = await run_db(_fetch_user_by_email, form_data.username)
         
         if not user or not verify_password(form_data.password, user[4]):
             raise HTTPException(
@@ -289,11 +442,7 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 @api_router.post("/login", response_model=Token)
 async def login(user_login: UserLogin):
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM users WHERE email = ?", (user_login.email,))
-        user = cursor.fetchone()
-        conn.close()
+        user = await run_db(_fetch_user_by_email, user_login.email)
         
         if not user or not verify_password(user_login.password, user[4]):
             raise HTTPException(
@@ -326,15 +475,16 @@ async def create_course(course: Course, current_user: User = Depends(get_current
         if current_user.role != "admin":
             raise HTTPException(status_code=403, detail="Only admins can create courses")
         
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO courses (name, description) VALUES (?, ?)",
-            (course.name, course.description)
-        )
-        course_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        def insert_course(conn):
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO courses (name, description) VALUES (?, ?)",
+                (course.name, course.description)
+            )
+            conn.commit()
+            return cursor.lastrowid
+        
+        course_id = await run_db(insert_course)
         
         return {"id": course_id, "name": course.name, "description": course.description}
     
@@ -348,22 +498,23 @@ async def create_course(course: Course, current_user: User = Depends(get_current
 @api_router.get("/courses")
 async def get_courses(current_user: User = Depends(get_current_user)):
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
+        def fetch_courses(conn):
+            cursor = conn.cursor()
+            
+            if current_user.role == "admin":
+                # Admin can see all courses
+                cursor.execute("SELECT * FROM courses")
+            else:
+                # Students see only assigned courses
+                cursor.execute("""
+                    SELECT c.* FROM courses c
+                    JOIN student_courses sc ON c.id = sc.course_id
+                    WHERE sc.user_id = ?
+                """, (current_user.id,))
+            
+            return cursor.fetchall()
         
-        if current_user.role == "admin":
-            # Admin can see all courses
-            cursor.execute("SELECT * FROM courses")
-        else:
-            # Students see only assigned courses
-            cursor.execute("""
-                SELECT c.* FROM courses c
-                JOIN student_courses sc ON c.id = sc.course_id
-                WHERE sc.user_id = ?
-            """, (current_user.id,))
-        
-        courses = cursor.fetchall()
-        conn.close()
+        courses = await run_db(fetch_courses)
         
         return [
             {
@@ -384,21 +535,22 @@ async def get_courses(current_user: User = Depends(get_current_user)):
 @api_router.get("/courses/{course_id}")
 async def get_course(course_id: int, current_user: User = Depends(get_current_user)):
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
+        def fetch_course(conn):
+            cursor = conn.cursor()
+            
+            # Check if user has access to this course
+            if current_user.role != "admin":
+                cursor.execute(
+                    "SELECT 1 FROM student_courses WHERE user_id = ? AND course_id = ?",
+                    (current_user.id, course_id)
+                )
+                if not cursor.fetchone():
+                    raise HTTPException(status_code=403, detail="Access denied to this course")
+            
+            cursor.execute("SELECT * FROM courses WHERE id = ?", (course_id,))
+            return cursor.fetchone()
         
-        # Check if user has access to this course
-        if current_user.role != "admin":
-            cursor.execute(
-                "SELECT 1 FROM student_courses WHERE user_id = ? AND course_id = ?",
-                (current_user.id, course_id)
-            )
-            if not cursor.fetchone():
-                raise HTTPException(status_code=403, detail="Access denied to this course")
-        
-        cursor.execute("SELECT * FROM courses WHERE id = ?", (course_id,))
-        course = cursor.fetchone()
-        conn.close()
+        course = await run_db(fetch_course)
         
         if not course:
             raise HTTPException(status_code=404, detail="Course not found")
@@ -424,29 +576,29 @@ async def assign_student_to_course(assignment: StudentAssignment, current_user:
         if current_user.role != "admin":
             raise HTTPException(status_code=403, detail="Only admins can assign students")
         
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        
-        # Check if user and course exist
-        cursor.execute("SELECT id FROM users WHERE id = ?", (assignment.user_id,))
-        if not cursor.fetchone():
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        cursor.execute("SELECT id FROM courses WHERE id = ?", (assignment.course_id,))
-        if not cursor.fetchone():
-            raise HTTPException(status_code=404, detail="Course not found")
-        
-        # Assign student to course
-        try:
-            cursor.execute(
-                "INSERT INTO student_courses (user_id, course_id) VALUES (?, ?)",
-                (assignment.user_id, assignment.course_id)
-            )
-            conn.commit()
-        except sqlite3.IntegrityError:
-            raise HTTPException(status_code=400, detail="Student already assigned to this course")
+        def insert_assignment(conn):
+            cursor = conn.cursor()
+            
+            # Check if user and course exist
+            cursor.execute("SELECT id FROM users WHERE id = ?", (assignment.user_id,))
+            if not cursor.fetchone():
+                raise HTTPException(status_code=404, detail="User not found")
+            
+            cursor.execute("SELECT id FROM courses WHERE id = ?", (assignment.course_id,))
+            if not cursor.fetchone():
+                raise HTTPException(status_code=404, detail="Course not found")
+            
+            # Assign student to course
+            try:
+                cursor.execute(
+                    "INSERT INTO student_courses (user_id, course_id) VALUES (?, ?)",
+                    (assignment.user_id, assignment.course_id)
+                )
+                conn.commit()
+            except sqlite3.IntegrityError:
+                raise HTTPException(status_code=400, detail="Student already assigned to this course")
         
-        conn.close()
+        await run_db(insert_assignment)
         return {"message": "Student assigned successfully"}
     
     except HTTPException:
@@ -456,27 +608,54 @@ async def assign_student_to_course(assignment: StudentAssignment, current_user:
         await send_error_notification(error_msg)
         raise HTTPException(status_code=500, detail="Failed to assign student")
 
+USER_FIELDS = ["id", "email", "first_name", "last_name", "role"]
+
 @api_router.get("/users")
-async def get_users(current_user: User = Depends(get_current_user)):
+async def get_users(
+    response: Response,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    course_id: Optional[int] = None,
+    name: Optional[str] = None,
+    fields: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
     try:
         if current_user.role != "admin":
             raise HTTPException(status_code=403, detail="Only admins can view users")
         
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, email, first_name, last_name, role FROM users")
-        users = cursor.fetchall()
-        conn.close()
+        limit = check_page_limit(limit, cursor)
+        selected = parse_fields(fields, USER_FIELDS)
+        # Sort key: (first_name, last_name, id)
+        after = decode_cursor(cursor, 3) if cursor else None
         
-        return [
-            {
-                "id": user[0],
-                "email": user[1],
-                "first_name": user[2],
-                "last_name": user[3],
-                "role": user[4]
-            } for user in users
-        ]
+        def fetch_users(conn):
+            conditions, params = ["1"], []
+            if course_id is not None:
+                conditions.append("EXISTS (SELECT 1 FROM student_courses sc WHERE sc.user_id = users.id AND sc.course_id = ?)")
+                params.append(course_id)
+            if name:
+                conditions.append("(first_name LIKE ? ESCAPE '\\' OR last_name LIKE ? ESCAPE '\\')")
+                params += [like_prefix(name)] * 2
+            if after is not None:
+                conditions.append("(first_name, last_name, id) > (?, ?, ?)")
+                params += after
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT id, email, first_name, last_name, role FROM users
+                WHERE {' AND '.join(conditions)}
+                ORDER BY first_name, last_name, id
+                LIMIT ?
+            """, (*params, -1 if limit is None else limit + 1))  # -1: no limit
+            return cursor.fetchall()
+        
+        users = await run_db(fetch_users)
+        if limit is not None and len(users) > limit:
+            users = users[:limit]
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor([users[-1][2], users[-1][3], users[-1][0]])
+        
+        columns = [USER_FIELDS.index(field) for field in selected]
+        return [{field: user[column] for field, column in zip(selected, columns)} for user in users]
     
     except HTTPException:
         raise
@@ -489,26 +668,27 @@ async def get_users(current_user: User = Depends(get_current_user)):
 @api_router.post("/time-tracking/start")
 async def start_time_tracking(tracking: TimeTrackingStart, current_user: User = Depends(get_current_user)):
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        
-        # Check if user has access to this course
-        if current_user.role != "admin":
+        def start_session(conn):
+            cursor = conn.cursor()
+            
+            # Check if user has access to this course
+            if current_user.role != "admin":
+                cursor.execute(
+                    "SELECT 1 FROM student_courses WHERE user_id = ? AND course_id = ?",
+                    (current_user.id, tracking.course_id)
+                )
+                if not cursor.fetchone():
+                    raise HTTPException(status_code=403, detail="Access denied to this course")
+            
+            # Start new time tracking session
             cursor.execute(
-                "SELECT 1 FROM student_courses WHERE user_id = ? AND course_id = ?",
-                (current_user.id, tracking.course_id)
+                "INSERT INTO time_tracking (user_id, course_id, session_start) VALUES (?, ?, ?)",
+                (current_user.id, tracking.course_id, datetime.utcnow())
             )
-            if not cursor.fetchone():
-                raise HTTPException(status_code=403, detail="Access denied to this course")
+            conn.commit()
+            return cursor.lastrowid
         
-        # Start new time tracking session
-        cursor.execute(
-            "INSERT INTO time_tracking (user_id, course_id, session_start) VALUES (?, ?, ?)",
-            (current_user.id, tracking.course_id, datetime.utcnow())
-        )
-        session_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        session_id = await run_db(start_session)
         
         return {"session_id": session_id, "message": "Time tracking started"}
     
@@ -522,31 +702,42 @@ async def start_time_tracking(tracking: TimeTrackingStart, current_user: User =
 @api_router.post("/time-tracking/end")
 async def end_time_tracking(tracking: TimeTrackingEnd, current_user: User = Depends(get_current_user)):
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        
-        # Get the session
-        cursor.execute(
-            "SELECT session_start FROM time_tracking WHERE id = ? AND user_id = ? AND session_end IS NULL",
-            (tracking.session_id, current_user.id)
-        )
-        session = cursor.fetchone()
-        
-        if not session:
-            raise HTTPException(status_code=404, detail="Active session not found")
-        
-        # Calculate duration
-        session_start = datetime.fromisoformat(session[0].replace('Z', '+00:00'))
-        session_end = datetime.utcnow()
-        duration_minutes = int((session_end - session_start).total_seconds() / 60)
+        def end_session(conn):
+            cursor = conn.cursor()
+            
+            # Get the session
+            cursor.execute(
+                "SELECT session_start FROM time_tracking WHERE id = ? AND user_id = ? AND session_end IS NULL",
+                (tracking.session_id, current_user.id)
+            )
+            session = cursor.fetchone()
+            
+            if not session:
+                raise HTTPException(status_code=404, detail="Active session not found")
+            
+            # Calculate duration
+            session_start = datetime.fromisoformat(session[0].replace('Z', '+00:00'))
+            session_end = datetime.utcnow()
+            duration_minutes = int((session_end - session_start).total_seconds() / 60)
+            
+            # Update session
+            cursor.execute(
+                "UPDATE time_tracking SET session_end = ?, duration_minutes = ? WHERE id = ?",
+                (session_end, duration_minutes, tracking.session_id)
+            )
+            for granularity, bucket_expression in PRACTICE_BUCKET_EXPRESSIONS.items():
+                cursor.execute(f"""
+                    INSERT INTO practice_buckets (user_id, granularity, bucket_start, course_id, total_minutes, session_count)
+                    SELECT user_id, ?, {bucket_expression}, course_id, duration_minutes, 1
+                    FROM time_tracking WHERE id = ?
+                    ON CONFLICT (user_id, granularity, bucket_start, course_id) DO UPDATE SET
+                        total_minutes = total_minutes + excluded.total_minutes,
+                        session_count = session_count + 1
+                """, (granularity, tracking.session_id))
+            conn.commit()
+            return duration_minutes
         
-        # Update session
-        cursor.execute(
-            "UPDATE time_tracking SET session_end = ?, duration_minutes = ? WHERE id = ?",
-            (session_end, duration_minutes, tracking.session_id)
-        )
-        conn.commit()
-        conn.close()
+        duration_minutes = await run_db(end_session)
         
         return {"message": "Time tracking ended", "duration_minutes": duration_minutes}
     
@@ -564,16 +755,17 @@ async def get_user_time_tracking(user_id: int, current_user: User = Depends(get_
         if current_user.role != "admin" and current_user.id != user_id:
             raise HTTPException(status_code=403, detail="Access denied")
         
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT tt.*, c.name as course_name FROM time_tracking tt
-            JOIN courses c ON tt.course_id = c.id
-            WHERE tt.user_id = ? AND tt.session_end IS NOT NULL
-            ORDER BY tt.session_start DESC
-        """, (user_id,))
-        sessions = cursor.fetchall()
-        conn.close()
+        def fetch_sessions(conn):
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT tt.*, c.name as course_name FROM time_tracking tt
+                JOIN courses c ON tt.course_id = c.id
+                WHERE tt.user_id = ? AND tt.session_end IS NOT NULL
+                ORDER BY tt.session_start DESC
+            """, (user_id,))
+            return cursor.fetchall()
+        
+        sessions = await run_db(fetch_sessions)
         
         return [
             {
@@ -593,63 +785,189 @@ async def get_user_time_tracking(user_id: int, current_user: User = Depends(get_
         await send_error_notification(error_msg)
         raise HTTPException(status_code=500, detail="Failed to fetch time tracking data")
 
+@api_router.get("/analytics/practice")
+async def get_practice_analytics(
+    granularity: str = "day",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    user_id: Optional[int] = None,
+    course_id: Optional[int] = None,
+    current_user: User = Depends(get_current_user)
+):
+    try:
+        if granularity not in PRACTICE_BUCKET_EXPRESSIONS:
+            raise HTTPException(status_code=400, detail="granularity must be 'day' or 'week'")
+        
+        # Users can only see their own data, admins can see any user's data
+        if current_user.role != "admin":
+            if user_id is not None and user_id != current_user.id:
+                raise HTTPException(status_code=403, detail="Access denied")
+            user_id = current_user.id
+        
+        step = timedelta(weeks=1) if granularity == "week" else timedelta(days=1)
+        floor = lambda day: day - timedelta(days=day.weekday()) if granularity == "week" else day
+        end = floor(end or datetime.utcnow().date())
+        start = floor(start) if start else end - step * (PRACTICE_DEFAULT_RANGE[granularity] - 1)
+        if start > end:
+            raise HTTPException(status_code=400, detail="start must not be after end")
+        if (end - start) // step >= PRACTICE_RANGE_LIMITS[granularity]:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Range is limited to {PRACTICE_RANGE_LIMITS[granularity]} {granularity}s"
+            )
+        
+        def fetch_buckets(conn):
+            conditions = ["b.granularity = ?", "b.bucket_start BETWEEN ? AND ?"]
+            params = [granularity, start.isoformat(), end.isoformat()]
+            if user_id is not None:
+                conditions.append("b.user_id = ?")
+                params.append(user_id)
+            if course_id is not None:
+                conditions.append("b.course_id = ?")
+                params.append(course_id)
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT b.user_id, b.course_id, c.name, b.bucket_start, b.total_minutes, b.session_count
+                FROM practice_buckets b
+                JOIN courses c ON c.id = b.course_id
+                WHERE {' AND '.join(conditions)}
+                ORDER BY b.user_id, b.bucket_start, b.course_id
+            """, params)
+            return cursor.fetchall()
+        
+        buckets = await run_db(fetch_buckets)
+        
+        return {
+            "granularity": granularity,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "buckets": [
+                {
+                    "user_id": bucket[0],
+                    "course_id": bucket[1],
+                    "course_name": bucket[2],
+                    "bucket_start": bucket[3],
+                    "total_minutes": bucket[4],
+                    "session_count": bucket[5]
+                } for bucket in buckets
+            ]
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        error_msg = f"Get practice analytics error: {str(e)}"
+        await send_error_notification(error_msg)
+        raise HTTPException(status_code=500, detail="Failed to fetch practice analytics")
+
 # File upload endpoint
-@api_router.post("/upload")
-async def upload_file(file: UploadFile = File(...), current_user: User = Depends(get_current_user)):
+UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["file"],
+            "properties": {"file": {"type": "string", "format": "binary"}},
+        }}},
+    }
+}
+
+@api_router.post("/upload", openapi_extra=UPLOAD_OPENAPI)
+async def upload_file(request: Request, current_user: User = Depends(get_current_user)):
+    temp_path = None
     try:
-        # Create uploads directory if it doesn't exist
-        upload_dir = "uploads"
-        os.makedirs(upload_dir, exist_ok=True)
+        # Streamed once into a temporary file in UPLOAD_DIR, then moved into place atomically
+        upload = await stage_multipart_upload(request, UPLOAD_DIR, MAX_UPLOAD_BYTES)
+        temp_path = upload.staged.temp_path
+        filename = os.path.basename(upload.filename.replace("\\", "/")).strip()
+        if filename in ("", ".", ".."):
+            raise HTTPException(status_code=400, detail="Invalid file name")
         
-        # Save file
-        file_path = os.path.join(upload_dir, file.filename)
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        os.replace(temp_path, os.path.join(UPLOAD_DIR, filename))
+        temp_path = None
         
-        return {"filename": file.filename, "message": "File uploaded successfully"}
+        return {"filename": filename, "size_bytes": upload.staged.size_bytes, "sha256": upload.staged.sha256, "message": "File uploaded successfully"}
     
+    except HTTPException:
+        raise
     except Exception as e:
         error_msg = f"File upload error: {str(e)}"
         await send_error_notification(error_msg)
         raise HTTPException(status_code=500, detail="Failed to upload file")
+    finally:
+        if temp_path is not None:
+            discard_staged_file(temp_path)
 
 # Get student assignments endpoint
+ASSIGNMENT_FIELDS = ["user_id", "student_name", "email", "course_id", "course_name", "assigned_at"]
+
 @api_router.get("/student-assignments")
-async def get_student_assignments(current_user: User = Depends(get_current_user)):
+async def get_student_assignments(
+    response: Response,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    course_id: Optional[int] = None,
+    name: Optional[str] = None,
+    fields: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
     try:
         if current_user.role != "admin":
             raise HTTPException(status_code=403, detail="Only admins can view student assignments")
         
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT 
-                sc.user_id,
-                u.first_name,
-                u.last_name,
-                u.email,
-                sc.course_id,
-                c.name as course_name,
-                sc.assigned_at
-            FROM student_courses sc
-            JOIN users u ON sc.user_id = u.id
-            JOIN courses c ON sc.course_id = c.id
-            ORDER BY sc.assigned_at DESC
-        """)
-        assignments = cursor.fetchall()
-        conn.close()
+        limit = check_page_limit(limit, cursor)
+        selected = parse_fields(fields, ASSIGNMENT_FIELDS)
+        # Sort key: newest first by (assigned_at, id)
+        after = decode_cursor(cursor, 2) if cursor else None
         
-        return [
-            {
+        def fetch_assignments(conn):
+            conditions, params = ["1"], []
+            if course_id is not None:
+                conditions.append("sc.course_id = ?")
+                params.append(course_id)
+            if name:
+                conditions.append("(u.first_name LIKE ? ESCAPE '\\' OR u.last_name LIKE ? ESCAPE '\\')")
+                params += [like_prefix(name)] * 2
+            if after is not None:
+                conditions.append("(sc.assigned_at, sc.id) < (?, ?)")
+                params += after
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT 
+                    sc.user_id,
+                    u.first_name,
+                    u.last_name,
+                    u.email,
+                    sc.course_id,
+                    c.name as course_name,
+                    sc.assigned_at,
+                    sc.id
+                FROM student_courses sc
+                JOIN users u ON sc.user_id = u.id
+                JOIN courses c ON sc.course_id = c.id
+                WHERE {' AND '.join(conditions)}
+                ORDER BY sc.assigned_at DESC, sc.id DESC
+                LIMIT ?
+            """, (*params, -1 if limit is None else limit + 1))  # -1: no limit
+            return cursor.fetchall()
+        
+        assignments = await run_db(fetch_assignments)
+        if limit is not None and len(assignments) > limit:
+            assignments = assignments[:limit]
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor([assignments[-1][6], assignments[-1][7]])
+        
+        rows = []
+        for assignment in assignments:
+            row = {
                 "user_id": assignment[0],
                 "student_name": f"{assignment[1]} {assignment[2]}",
                 "email": assignment[3],
                 "course_id": assignment[4],
                 "course_name": assignment[5],
                 "assigned_at": assignment[6]
-            } for assignment in assignments
-        ]
+            }
+            rows.append({field: row[field] for field in selected})
+        return rows
     
     except HTTPException:
         raise
@@ -661,7 +979,7 @@ async def get_student_assignments(current_user: User = Depends(get_current_user)
 # Health check endpoint
 @api_router.get("/health")
 async def health_check():
-    return {"status": "healthy", "message": "Sai Kalpataru API is running"}
+    return {"status": "healthy", "message": "Sai Kalpataru API is running", "startup": STARTUP_REPORT}
 
 # Include API router
 app.include_router(api_router)
@@ -690,6 +1008,21 @@ async def global_exception_handler(request, exc):
 # Export app for Vercel
 handler = app
 
+# Cold start report: import time (which includes init_db) against a budget,
+# logged once per instance and returned by /api/health. For a per-module
+# breakdown run ``python -X importtime index.py``.
+COLD_START_BUDGET_SECONDS = float(os.getenv("COLD_START_BUDGET_SECONDS", "1.0"))
+_import_seconds = time.perf_counter() - IMPORT_STARTED
+STARTUP_REPORT = {
+    "import_seconds": round(_import_seconds, 3),
+    "init_db_seconds": round(_init_seconds, 3),
+    "budget_seconds": COLD_START_BUDGET_SECONDS,
+    "within_budget": _import_seconds <= COLD_START_BUDGET_SECONDS,
+}
+(logger.info if STARTUP_REPORT["within_budget"] else logger.warning)(
+    f"Cold start took {_import_seconds:.3f}s (init_db {_init_seconds:.3f}s, budget {COLD_START_BUDGET_SECONDS}s)"
+)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,93 @@
+"""Write benchmark: per-request commits vs. the single group-committing writer.
+
+    python bench_writes.py [--operations 2000] [--concurrency 32] [--busy-timeout 0.05]
+
+Each operation records one finished practice session (time_tracking row,
+progress_rollup and practice_buckets), the same work as stopping a session.
+"before" runs every operation in its own transaction on a pooled connection
+from many threads, the way request handlers used to write; "after" sends
+them through DatabaseWriter. A throwaway database is used, so this is safe
+to run anywhere. Lower --busy-timeout to make lock contention visible.
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument("--operations", type=int, default=2000)
+parser.add_argument("--concurrency", type=int, default=32)
+parser.add_argument("--busy-timeout", type=float, default=0.05,
+                    help="seconds a connection waits for the write lock (DB_BUSY_TIMEOUT)")
+args = parser.parse_args()
+
+workdir = tempfile.mkdtemp(prefix="bench-writes-")
+os.environ["DATABASE_PATH"] = os.path.join(workdir, "bench.db")
+os.environ["DB_BUSY_TIMEOUT"] = str(args.busy_timeout)
+os.environ["DB_POOL_SIZE"] = str(args.concurrency)
+os.environ["DB_WRITER_QUEUE_DEPTH"] = str(args.operations)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import main  # noqa: E402  (configured through the environment above)
+
+def record_session(conn: sqlite3.Connection, user_id: int, course_id: int):
+    session_id = conn.execute("""
+        INSERT INTO time_tracking (user_id, course_id, start_time, end_time, duration_seconds)
+        VALUES (?, ?, datetime('now', '-60 seconds'), CURRENT_TIMESTAMP, 60)
+    """, (user_id, course_id)).lastrowid
+    main.add_session_to_rollup(conn, session_id)
+    main.add_session_to_buckets(conn, session_id)
+
+def is_lock_error(error: Exception) -> bool:
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in str(error) or "busy" in str(error))
+
+def report(label: str, elapsed: float, errors: list):
+    done = args.operations - len(errors)
+    locked = sum(1 for error in errors if is_lock_error(error))
+    print(f"{label:>6}: {done / elapsed:8.0f} writes/s  "
+          f"{locked} lock errors ({locked / args.operations:.1%}), {len(errors) - locked} other errors")
+
+def run_before():
+    def write(i):
+        try:
+            with main.db_pool.connection() as conn:
+                record_session(conn, i % 50, i % 3 + 1)
+                conn.commit()
+        except Exception as e:
+            return e
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        errors = [error for error in pool.map(write, range(args.operations)) if error]
+    report("before", time.perf_counter() - started, errors)
+
+async def run_after():
+    slots = asyncio.Semaphore(args.concurrency)
+
+    async def write(i):
+        async with slots:
+            try:
+                await main.db_writer.run(record_session, i % 50, i % 3 + 1)
+            except Exception as e:
+                return e
+
+    started = time.perf_counter()
+    errors = [error for error in await asyncio.gather(*(write(i) for i in range(args.operations))) if error]
+    report("after", time.perf_counter() - started, errors)
+    stats = main.db_writer.stats()
+    print(f"        {stats['transactions']} transactions, "
+          f"{stats['operations_per_transaction']} writes each, largest batch {stats['largest_batch']}")
+
+if __name__ == "__main__":
+    main.init_db()
+    print(f"{args.operations} writes, {args.concurrency} concurrent, busy timeout {args.busy_timeout}s")
+    run_before()
+    asyncio.run(run_after())
+    main.db_writer.shutdown()
+    with main.db_pool.connection() as conn:
+        print("progress rollup consistent:", not main.check_progress_rollup(conn))
+    main.db_pool.close_all()
@@ -1,22 +1,50 @@
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form, APIRouter
+import time
+
+IMPORT_STARTED = time.perf_counter()  # see startup_report
+
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, APIRouter, Request
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from concurrent.futures import Future, ThreadPoolExecutor
+import asyncio
+import base64
+import bisect
+import csv
 import hashlib
+import io
+import itertools
+import hmac
+import re
+import secrets
+import tempfile
+import mimetypes
+import random
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote
 from jose import JWTError, jwt
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from typing import Optional, List
+from contextlib import contextmanager, suppress
+from collections import OrderedDict, deque
 import sqlite3
+import queue
+import threading
+import zlib
 import os
 import json
-import httpx
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, ValidationError
 import logging
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from twilio.rest import Client
+
+from streaming_upload import (
+    StagedUpload,
+    UploadSizeLimitMiddleware,
+    discard_staged_file,
+    stage_multipart_upload,
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -28,27 +56,219 @@ NOTIFICATION_PHONE = "+17324076946"
 TWILIO_SID = os.getenv("TWILIO_SID")
 TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 TWILIO_PHONE = os.getenv("TWILIO_PHONE")
+SMTP_HOST = os.getenv("SMTP_HOST")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_USER = os.getenv("SMTP_USER")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_FROM = os.getenv("SMTP_FROM", SMTP_USER or NOTIFICATION_EMAIL)
+NOTIFY_QUEUE_DEPTH = int(os.getenv("NOTIFY_QUEUE_DEPTH", "100"))
+NOTIFY_DEDUP_SECONDS = float(os.getenv("NOTIFY_DEDUP_SECONDS", "600"))
+NOTIFY_DIGEST_SECONDS = float(os.getenv("NOTIFY_DIGEST_SECONDS", "300"))
+NOTIFY_SEND_TIMEOUT = float(os.getenv("NOTIFY_SEND_TIMEOUT", "10"))
+NOTIFY_RATE_LIMITS = {  # messages per hour and channel
+    "sms": int(os.getenv("NOTIFY_SMS_PER_HOUR", "6")),
+    "email": int(os.getenv("NOTIFY_EMAIL_PER_HOUR", "30")),
+}
+NOTIFY_DIGEST_LINES = 10
+
+# Error notifications: requests only log the error and hand it to a
+# background worker, so a slow or failing SMS/email provider never adds to
+# request latency. Errors are fingerprinted with their numbers and quoted
+# values masked; the first of a kind is sent straight away and repeats within
+# NOTIFY_DEDUP_SECONDS are counted into a digest sent every
+# NOTIFY_DIGEST_SECONDS. Each channel has its own hourly limit, and messages
+# over it are counted in the next digest instead of being sent.
+_VOLATILE_ERROR_PARTS = re.compile(r"'[^']*'|\"[^\"]*\"|0x[0-9a-fA-F]+|\d+")
+
+def error_fingerprint(error_details: str) -> str:
+    return _VOLATILE_ERROR_PARTS.sub("#", error_details)[:300]
+
+def _send_sms(text: str):
+    from twilio.rest import Client  # slow to import, and rarely needed
+    client = Client(TWILIO_SID, TWILIO_AUTH_TOKEN)
+    message = client.messages.create(body=text[:300], from_=TWILIO_PHONE, to=NOTIFICATION_PHONE)
+    logger.info(f"SMS notification sent: {message.sid}")
+
+def _send_email(text: str):
+    import smtplib
+    from email.message import EmailMessage
+    message = EmailMessage()
+    message["Subject"] = text.splitlines()[0][:150]
+    message["From"] = SMTP_FROM
+    message["To"] = NOTIFICATION_EMAIL
+    message.set_content(text)
+    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=NOTIFY_SEND_TIMEOUT) as smtp:
+        smtp.starttls()
+        if SMTP_USER:
+            smtp.login(SMTP_USER, SMTP_PASSWORD)
+        smtp.send_message(message)
+
+class HourlyRateLimit:
+    """Token bucket allowing ``per_hour`` messages, refilled continuously"""
+
+    def __init__(self, per_hour: int):
+        self.per_hour = per_hour
+        self._tokens = float(per_hour)
+        self._updated = time.monotonic()
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        self._tokens = min(self.per_hour, self._tokens + (now - self._updated) * self.per_hour / 3600)
+        self._updated = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+class ErrorNotifier:
+    """Background worker that sends error alerts and digests.
+
+    ``submit`` is called on the event loop and never blocks: alerts go into a
+    bounded queue, and anything that does not fit is folded into the digest.
+    Providers are called on the thread pool, one message at a time.
+    """
+
+    def __init__(self, channels: dict, queue_depth: int, dedup_seconds: float, digest_seconds: float, rate_limits: dict):
+        self.channels = channels  # name -> blocking send(text)
+        self.queue_depth = queue_depth
+        self.dedup_seconds = dedup_seconds
+        self.digest_seconds = digest_seconds
+        self._limits = {name: HourlyRateLimit(rate_limits[name]) for name in channels}
+        self._queue = None
+        self._task = None
+        self._last_alert = {}  # fingerprint -> monotonic time of its last alert
+        self._digest = {}  # fingerprint -> [count, latest details]
+        self._suppressed = dict.fromkeys(channels, 0)
+        self.submitted = 0
+        self.deduplicated = 0
+        self.dropped = 0
+        self.sent = dict.fromkeys(channels, 0)
+        self.rate_limited = dict.fromkeys(channels, 0)
+        self.failed = dict.fromkeys(channels, 0)
+
+    def submit(self, error_details: str):
+        self.submitted += 1
+        if self._queue is None:
+            return  # not serving (maintenance commands); the error is already logged
+        fingerprint = error_fingerprint(error_details)
+        now = time.monotonic()
+        last = self._last_alert.get(fingerprint)
+        if last is not None and now - last < self.dedup_seconds:
+            self.deduplicated += 1
+            self._add_to_digest(fingerprint, error_details)
+            return
+        try:
+            self._queue.put_nowait(error_details)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            self._add_to_digest(fingerprint, error_details)
+            return
+        self._last_alert[fingerprint] = now
+
+    def _add_to_digest(self, fingerprint: str, error_details: str):
+        entry = self._digest.get(fingerprint)
+        if entry is None:
+            self._digest[fingerprint] = [1, error_details]
+        else:
+            entry[0] += 1
+            entry[1] = error_details
+
+    def start(self):
+        if not self.channels or self._task is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_depth)
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        next_digest = time.monotonic() + self.digest_seconds
+        while True:
+            try:
+                error_details = await asyncio.wait_for(self._queue.get(), max(0, next_digest - time.monotonic()))
+            except asyncio.TimeoutError:
+                await self._send_digest()
+                next_digest = time.monotonic() + self.digest_seconds
+                continue
+            await self._deliver(f"Sai Kalpataru App Error: {error_details}")
+
+    async def _deliver(self, text: str):
+        for name, send in self.channels.items():
+            if not self._limits[name].allow():
+                self.rate_limited[name] += 1
+                self._suppressed[name] += 1
+                continue
+            try:
+                await run_in_threadpool(send, text)
+                self.sent[name] += 1
+            except Exception as e:
+                self.failed[name] += 1
+                logger.error(f"Failed to send {name} error notification: {str(e)}")
+
+    def _digest_text(self) -> Optional[str]:
+        suppressed = sum(self._suppressed.values())
+        if not self._digest and not suppressed:
+            return None
+        lines = [f"Sai Kalpataru App error digest, last {round(self.digest_seconds / 60, 1):g} min"]
+        if self._digest:
+            repeats = sum(count for count, _ in self._digest.values())
+            lines.append(f"{repeats} errors not alerted individually:")
+        for count, error_details in sorted(self._digest.values(), key=lambda entry: -entry[0])[:NOTIFY_DIGEST_LINES]:
+            lines.append(f"{count}x {error_details[:200]}")
+        if len(self._digest) > NOTIFY_DIGEST_LINES:
+            lines.append(f"... and {len(self._digest) - NOTIFY_DIGEST_LINES} more kinds")
+        if suppressed:
+            lines.append(f"{suppressed} alerts held back by rate limits")
+        return "\n".join(lines)
+
+    async def _send_digest(self):
+        text = self._digest_text()
+        cutoff = time.monotonic() - self.dedup_seconds
+        self._last_alert = {fp: at for fp, at in self._last_alert.items() if at > cutoff}
+        if text is None:
+            return
+        self._digest.clear()
+        self._suppressed = dict.fromkeys(self.channels, 0)
+        await self._deliver(text)
+
+    async def stop(self):
+        """Stop the worker; alerts still queued and the pending digest are only logged"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+        pending = self._queue.qsize()
+        self._queue = None
+        text = self._digest_text()
+        if pending or text:
+            logger.warning(f"Error notifications not sent at shutdown: {pending} alerts; digest: {text}")
+
+    def stats(self) -> dict:
+        return {
+            "channels": list(self.channels),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "submitted": self.submitted,
+            "deduplicated": self.deduplicated,
+            "dropped": self.dropped,
+            "pending_digest": sum(count for count, _ in self._digest.values()),
+            "sent": dict(self.sent),
+            "rate_limited": dict(self.rate_limited),
+            "failed": dict(self.failed),
+        }
+
+_notification_channels = {}
+if TWILIO_SID and TWILIO_AUTH_TOKEN and TWILIO_PHONE:
+    _notification_channels["sms"] = _send_sms
+if SMTP_HOST:
+    _notification_channels["email"] = _send_email
+error_notifier = ErrorNotifier(
+    _notification_channels, NOTIFY_QUEUE_DEPTH, NOTIFY_DEDUP_SECONDS, NOTIFY_DIGEST_SECONDS, NOTIFY_RATE_LIMITS
+)
 
-# Error notification functions
 async def send_error_notification(error_details: str):
-    """Send error notification via SMS and email"""
-    try:
-        # Send SMS notification
-        if TWILIO_SID and TWILIO_AUTH_TOKEN and TWILIO_PHONE:
-            client = Client(TWILIO_SID, TWILIO_AUTH_TOKEN)
-            message = client.messages.create(
-                body=f"Sai Kalpataru App Error: {error_details[:100]}...",
-                from_=TWILIO_PHONE,
-                to=NOTIFICATION_PHONE
-            )
-            logger.info(f"SMS notification sent: {message.sid}")
-        
-        # Send email notification (you can configure SMTP settings)
-        # For now, just log the error
-        logger.error(f"Application Error for notification: {error_details}")
-        
-    except Exception as e:
-        logger.error(f"Failed to send error notification: {str(e)}")
+    """Log an error and queue it for SMS/email; returns without waiting on any provider"""
+    logger.error(f"Application Error for notification: {error_details}")
+    error_notifier.submit(error_details)
 
 app = FastAPI(title="Sai Kalpataru Student Management System")
 
@@ -60,6 +280,17 @@ static_path = "static/assets" if os.path.exists("static/assets") else "../fronte
 if os.path.exists(static_path):
     app.mount("/assets", StaticFiles(directory=static_path), name="static")
 
+# Uploads
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(200 * 1024 * 1024)))
+MULTIPART_OVERHEAD_BYTES = 64 * 1024  # boundaries and the small form fields around the file
+
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    paths=["/api/upload-material", "/api/admin/import-students"],
+    max_bytes=MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES,
+)
+
 # CORS configuration
 app.add_middleware(
     CORSMiddleware,
@@ -67,6 +298,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Profile-Id"],
 )
 
 # Security
@@ -75,18 +307,1132 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/token")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/token", auto_error=False)
+
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "2048"))
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+
+class TTLCache:
+    """Thread-safe bounded LRU cache whose entries also expire after ``ttl`` seconds.
+
+    Loaders read ``generation`` before fetching and pass it back to ``set``;
+    if anything was invalidated in between, the possibly stale value is dropped.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, generation: Optional[int] = None):
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = (time.monotonic() + self._ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self._max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self._max_size,
+                "ttl_seconds": self._ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+# Resolved users keyed by token subject (email), without the password hash
+principal_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL_SECONDS)
+
+def invalidate_user(email: str):
+    """Call after any change to a users row so auth stops serving the old copy."""
+    principal_cache.invalidate(email)
+
+# "lookup" tokens carry only the email and are resolved against the users
+# table; "claims" tokens also carry id, role, names and a token version as
+# signed claims, so requests authenticate without any SQL.
+AUTH_TOKEN_MODE = os.getenv("AUTH_TOKEN_MODE", "lookup")
+
+class TokenRevocations:
+    """In-memory revoked token ids and per-user token versions.
+
+    Logging out revokes one token by its ``jti``; bumping a user's version
+    (role or credential change) invalidates every token issued before it.
+    Revoked ids are kept only until the token would have expired anyway.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._revoked = {}
+        self._versions = {}
+
+    def revoke(self, jti: str, expires_at: float):
+        now = time.time()
+        with self._lock:
+            self._revoked[jti] = expires_at
+            if len(self._revoked) % 256 == 0:
+                self._revoked = {k: exp for k, exp in self._revoked.items() if exp > now}
+
+    def is_revoked(self, jti: Optional[str]) -> bool:
+        return jti is not None and jti in self._revoked
+
+    def current_version(self, user_id: int) -> int:
+        return self._versions.get(user_id, 0)
+
+    def bump_version(self, user_id: int) -> int:
+        with self._lock:
+            version = self._versions.get(user_id, 0) + 1
+            self._versions[user_id] = version
+            return version
+
+    def stats(self) -> dict:
+        return {"revoked_tokens": len(self._revoked), "versioned_users": len(self._versions)}
+
+token_revocations = TokenRevocations()
+
+# Metrics: request counts, latency histograms and database timings, kept in
+# process memory and rendered in the Prometheus text format by /api/metrics.
+# Labels are bounded: routes are the matched path templates, never raw URLs.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last slot is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+class MetricFamily:
+    """One metric name with a child per combination of label values."""
+
+    def __init__(self, name: str, kind: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.label_names = labels
+        self._buckets = buckets
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = _Histogram(self._buckets) if self.kind == "histogram" else _Value()
+                    self._children[values] = child
+        return child
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            labels = [f'{name}="{_escape_label(value)}"' for name, value in zip(self.label_names, values)]
+            if self.kind != "histogram":
+                lines.append(f"{self.name}{_format_labels(labels)} {child.value}")
+                continue
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip([*map(repr, child.buckets), "+Inf"], counts):
+                cumulative += count
+                bucket_labels = [*labels, f'le="{bound}"']
+                lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels: List[str]) -> str:
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+class MetricsRegistry:
+    def __init__(self):
+        self._families = []
+        self._collectors = []
+
+    def add(self, name: str, kind: str, help: str, labels=(), buckets=LATENCY_BUCKETS) -> MetricFamily:
+        family = MetricFamily(name, kind, help, labels, buckets)
+        self._families.append(family)
+        return family
+
+    def gauge_callback(self, name: str, help: str, fn):
+        """Gauge read from ``fn()`` when the metrics are scraped"""
+        self._collectors.append((name, help, fn))
+
+    def render(self) -> str:
+        lines = []
+        for family in self._families:
+            lines += family.render()
+        for name, help, fn in self._collectors:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {fn()}"]
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+http_requests_total = metrics.add(
+    "http_requests_total", "counter", "HTTP requests by route, method and status class", ("route", "method", "status")
+)
+http_requests_in_flight = metrics.add(
+    "http_requests_in_flight", "gauge", "HTTP requests being served", ("method",)
+)
+http_request_duration_seconds = metrics.add(
+    "http_request_duration_seconds", "histogram", "Time to serve a request, including the response body",
+    ("route", "method")
+)
+db_connection_wait_seconds = metrics.add(
+    "db_connection_wait_seconds", "histogram", "Time a request waited to check out a pooled connection"
+).labels()
+db_queue_wait_seconds = metrics.add(
+    "db_queue_wait_seconds", "histogram", "Time database work waited for its thread", ("pool",)
+)
+db_query_seconds = metrics.add(
+    "db_query_seconds", "histogram", "Time spent on database work: one read call or one write transaction",
+    ("pool",)
+)
+
+class MetricsMiddleware:
+    """Per-route request counts, in-flight gauge and latency histogram.
+
+    A plain ASGI middleware, so it adds a few dictionary lookups per request
+    and never buffers or wraps the body. The route label is read from the
+    scope after routing and is the path template ("/api/course-materials/{course_id}").
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_flight = http_requests_in_flight.labels(method)
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            in_flight.dec()
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            http_requests_total.labels(route, method, f"{status_code // 100}xx").inc()
+            http_request_duration_seconds.labels(route, method).observe(elapsed)
+
+app.add_middleware(MetricsMiddleware)
+
+# SQL profiler, opt-in with SQL_PROFILE=1. Connections are opened with a
+# connection and cursor factory that time the SQLite calls themselves: a
+# statement's time is its execute plus every fetch that steps through its
+# rows, and commits and rollbacks are timed on their own. Python work between
+# those calls is not charged to any statement. Statements are grouped by
+# fingerprint (literals replaced with ?), slow ones are logged and have their
+# EXPLAIN QUERY PLAN captured, and /api/admin/sql-profile reports the
+# fingerprints by total time. Only fingerprints are kept, never SQL text with
+# literals in it.
+SQL_PROFILE = os.getenv("SQL_PROFILE", "").lower() in ("1", "true", "yes")
+SQL_PROFILE_SLOW_MS = float(os.getenv("SQL_PROFILE_SLOW_MS", "50"))
+SQL_PROFILE_MAX_FINGERPRINTS = int(os.getenv("SQL_PROFILE_MAX_FINGERPRINTS", "1000"))
+SQL_PROFILE_SLOW_LOG_SIZE = int(os.getenv("SQL_PROFILE_SLOW_LOG_SIZE", "100"))
+SQL_PROFILE_FINGERPRINT_CHARS = 2000
+
+_SQL_STRING = re.compile(r"'(?:[^']|'')*'")
+_SQL_NUMBER = re.compile(r"(?<![\w.])\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_SQL_VALUE_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SQL_WHITESPACE = re.compile(r"\s+")
+_EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH|INSERT|REPLACE|UPDATE|DELETE)\b", re.IGNORECASE)
+
+def redact_sql(sql: str) -> str:
+    """``sql`` with string and number literals replaced by ?"""
+    return _SQL_NUMBER.sub("?", _SQL_STRING.sub("?", sql))
+
+def sql_fingerprint(redacted: str) -> str:
+    """Redacted SQL with whitespace and value lists collapsed, so calls differing only in values group together"""
+    sql = _SQL_WHITESPACE.sub(" ", redacted).strip()
+    return _SQL_VALUE_LIST.sub("(?, ...)", sql)[:SQL_PROFILE_FINGERPRINT_CHARS]
+
+class SqlProfiler:
+    """Per-fingerprint statement timings fed by ProfiledConnection.
+
+    A statement whose rows are still being read stays open on the thread that
+    ran it, so the fetches that follow are added to it; it is recorded once
+    its rows are exhausted, its cursor is reused or closed, or the database
+    call ends with ``finish`` on that thread. Query plans are captured in
+    ``finish`` too, once the call's own statements are done. Plans are taken
+    from the redacted statement with NULL bound to every placeholder.
+    """
+
+    def __init__(self, enabled: bool, slow_seconds: float, max_fingerprints: int, slow_log_size: int):
+        self.enabled = enabled
+        self.slow_seconds = slow_seconds
+        self._max_fingerprints = max_fingerprints
+        self._stats = {}  # fingerprint -> aggregate
+        self._slow_log = deque(maxlen=slow_log_size)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.untracked_statements = 0
+        self.since = datetime.utcnow()
+
+    def _open_statements(self) -> list:
+        local = self._local
+        if not hasattr(local, "open"):
+            local.open = []
+        return local.open
+
+    def executed(self, sql: str, seconds: float, has_rows: bool):
+        """Account for one execute; returns the open statement when rows remain to be fetched"""
+        if getattr(self._local, "paused", False):
+            return None
+        if not has_rows:
+            self._record(sql, seconds)
+            return None
+        statement = [sql, seconds]
+        self._open_statements().append(statement)
+        return statement
+
+    def fetched(self, statement, seconds: float):
+        if statement is not None:
+            statement[1] += seconds
+
+    def close(self, statement):
+        """The statement's rows are done; record it unless ``finish`` already did"""
+        if statement is None:
+            return
+        open_statements = self._open_statements()
+        for i, candidate in enumerate(open_statements):
+            if candidate is statement:
+                del open_statements[i]
+                self._record(*statement)
+                return
+
+    def finish(self, conn: sqlite3.Connection):
+        """End of a database call on this thread"""
+        local = self._local
+        open_statements, local.open = getattr(local, "open", None), []
+        for statement in open_statements or ():
+            self._record(*statement)
+        pending, local.explain = getattr(local, "explain", None), None
+        if pending:
+            local.paused = True
+            try:
+                for fingerprint, redacted in pending:
+                    self._explain(conn, fingerprint, redacted)
+            finally:
+                local.paused = False
+
+    def _record(self, sql: str, seconds: float):
+        redacted = redact_sql(sql)
+        fingerprint = sql_fingerprint(redacted)
+        slow = seconds >= self.slow_seconds
+        with self._lock:
+            stat = self._stats.get(fingerprint)
+            if stat is None:
+                if len(self._stats) >= self._max_fingerprints:
+                    self.untracked_statements += 1
+                    return
+                stat = self._stats[fingerprint] = {
+                    "calls": 0, "total_seconds": 0.0, "max_seconds": 0.0, "slow_calls": 0, "plan": None,
+                }
+            stat["calls"] += 1
+            stat["total_seconds"] += seconds
+            stat["max_seconds"] = max(stat["max_seconds"], seconds)
+            if not slow:
+                return
+            stat["slow_calls"] += 1
+            self._slow_log.append({
+                "at": datetime.utcnow().isoformat(timespec="seconds"),
+                "ms": round(seconds * 1000, 2),
+                "fingerprint": fingerprint,
+            })
+            explain = stat["plan"] is None and _EXPLAINABLE.match(fingerprint)
+            if explain:
+                stat["plan"] = []  # claimed; filled in by finish
+        logger.warning(f"Slow query ({seconds * 1000:.1f} ms): {fingerprint[:500]}")
+        if explain:
+            if getattr(self._local, "explain", None) is None:
+                self._local.explain = []
+            self._local.explain.append((fingerprint, redacted))
+
+    def _explain(self, conn: sqlite3.Connection, fingerprint: str, redacted: str):
+        try:
+            plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + redacted, (None,) * redacted.count("?"))]
+        except sqlite3.Error as e:
+            plan = [f"unavailable: {e}"]
+        with self._lock:
+            if fingerprint in self._stats:
+                self._stats[fingerprint]["plan"] = plan
+
+    def report(self, limit: int) -> dict:
+        with self._lock:
+            stats = sorted(self._stats.items(), key=lambda item: item[1]["total_seconds"], reverse=True)
+            top = [
+                {
+                    "fingerprint": fingerprint,
+                    "calls": stat["calls"],
+                    "total_ms": round(stat["total_seconds"] * 1000, 2),
+                    "mean_ms": round(stat["total_seconds"] * 1000 / stat["calls"], 3),
+                    "max_ms": round(stat["max_seconds"] * 1000, 2),
+                    "slow_calls": stat["slow_calls"],
+                    "plan": stat["plan"],
+                } for fingerprint, stat in stats[:limit]
+            ]
+            return {
+                "enabled": self.enabled,
+                "slow_ms": self.slow_seconds * 1000,
+                "since": self.since.isoformat(timespec="seconds"),
+                "fingerprints": len(stats),
+                "untracked_statements": self.untracked_statements,
+                "top": top,
+                "slow_log": list(self._slow_log),
+            }
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._slow_log.clear()
+            self.untracked_statements = 0
+            self.since = datetime.utcnow()
+
+sql_profiler = SqlProfiler(SQL_PROFILE, SQL_PROFILE_SLOW_MS / 1000, SQL_PROFILE_MAX_FINGERPRINTS, SQL_PROFILE_SLOW_LOG_SIZE)
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor that reports the time spent in its execute and fetch calls to ``sql_profiler``"""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._statement = None
+
+    def _run(self, method, sql: str, *args):
+        sql_profiler.close(self._statement)
+        self._statement = None
+        started = time.perf_counter()
+        try:
+            return method(sql, *args)
+        finally:
+            self._statement = sql_profiler.executed(sql, time.perf_counter() - started, self.description is not None)
+
+    def _fetch(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            sql_profiler.fetched(self._statement, time.perf_counter() - started)
+
+    def _done(self):
+        sql_profiler.close(self._statement)
+        self._statement = None
+
+    def execute(self, sql, parameters=()):
+        return self._run(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._run(super().executemany, sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self._run(super().executescript, sql_script)
+
+    def fetchone(self):
+        row = self._fetch(super().fetchone)
+        if row is None:
+            self._done()
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._fetch(super().fetchmany, self.arraysize if size is None else size)
+        if not rows:
+            self._done()
+        return rows
+
+    def fetchall(self):
+        rows = self._fetch(super().fetchall)
+        self._done()
+        return rows
+
+    def __next__(self):
+        try:
+            return self._fetch(super().__next__)
+        except StopIteration:
+            self._done()
+            raise
+
+    def close(self):
+        self._done()
+        super().close()
+
+class ProfiledConnection(sqlite3.Connection):
+    """Connection whose statements go through ProfiledCursor; commits and rollbacks are timed too.
+
+    ``sqlite3.Connection.execute`` and friends create their cursor in C without
+    going through ``cursor()``, so they are overridden here as well.
+    """
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+    def _timed(self, method, label: str):
+        started = time.perf_counter()
+        try:
+            method()
+        finally:
+            sql_profiler.executed(label, time.perf_counter() - started, False)
+
+    def commit(self):
+        self._timed(super().commit, "COMMIT")
+
+    def rollback(self):
+        self._timed(super().rollback, "ROLLBACK")
 
 # Database setup
-def get_db_connection():
-    conn = sqlite3.connect("database.db")
+DATABASE_PATH = os.getenv("DATABASE_PATH", "database.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "5"))
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "16384"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(128 * 1024 * 1024)))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "8"))
+DB_EXECUTOR_QUEUE_DEPTH = int(os.getenv("DB_EXECUTOR_QUEUE_DEPTH", "64"))
+DB_WRITER_QUEUE_DEPTH = int(os.getenv("DB_WRITER_QUEUE_DEPTH", "256"))
+DB_WRITER_BATCH_SIZE = int(os.getenv("DB_WRITER_BATCH_SIZE", "64"))
+
+class PoolTimeoutError(Exception):
+    pass
+
+class DatabaseBusyError(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=503, detail="Server is busy, please retry")
+
+def open_db_connection():
+    """Open a tuned SQLite connection meant to be kept alive by the pool."""
+    conn = sqlite3.connect(
+        DATABASE_PATH,
+        timeout=DB_BUSY_TIMEOUT,
+        check_same_thread=False,  # connections move between worker threads, one holder at a time
+        cached_statements=DB_STATEMENT_CACHE_SIZE,
+        factory=ProfiledConnection if sql_profiler.enabled else sqlite3.Connection,
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store = MEMORY")
     return conn
 
-# Initialize database tables
-def init_db():
-    conn = get_db_connection()
-    
-    conn.execute("""
+class ConnectionPool:
+    """Bounded pool of long-lived SQLite connections.
+
+    Connections are created lazily up to ``max_size`` and handed out to one
+    holder at a time. Idle connections are reused most-recently-used first so
+    their page cache stays warm.
+    """
+
+    def __init__(self, factory, max_size: int, timeout: float):
+        self._factory = factory
+        self._max_size = max_size
+        self._timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._size = 0
+
+    def acquire(self, block: bool = True) -> Optional[sqlite3.Connection]:
+        """Check out a connection; with ``block=False`` return None instead of waiting."""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        
+        with self._lock:
+            can_create = self._size < self._max_size
+            if can_create:
+                self._size += 1
+        if can_create:
+            try:
+                return self._factory()
+            except Exception:
+                with self._lock:
+                    self._size -= 1
+                raise
+        
+        if not block:
+            return None
+        try:
+            return self._idle.get(timeout=self._timeout)
+        except queue.Empty:
+            raise PoolTimeoutError(f"No database connection available after {self._timeout}s")
+
+    def release(self, conn: sqlite3.Connection):
+        try:
+            # Never hand a half-finished transaction to the next holder
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        self._idle.put(conn)
+
+    def _discard(self, conn: sqlite3.Connection):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._size -= 1
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            if sql_profiler.enabled:
+                sql_profiler.finish(conn)
+            self.release(conn)
+
+    def stats(self) -> dict:
+        return {"open": self._size, "idle": self._idle.qsize()}
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+db_pool = ConnectionPool(open_db_connection, DB_POOL_SIZE, DB_POOL_TIMEOUT)
+metrics.gauge_callback("db_pool_connections", "Open pooled read connections", lambda: db_pool.stats()["open"])
+metrics.gauge_callback("db_pool_idle_connections", "Pooled read connections not checked out", lambda: db_pool.stats()["idle"])
+
+class DatabaseExecutor:
+    """Dedicated thread pool for blocking SQLite calls.
+
+    At most ``workers + queue_depth`` jobs may be running or waiting; beyond
+    that callers get a 503 instead of piling up behind a slow query.
+    """
+
+    def __init__(self, workers: int, queue_depth: int):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db")
+        self._slots = threading.BoundedSemaphore(workers + queue_depth)
+
+    def submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise DatabaseBusyError()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    async def run(self, fn, *args):
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+db_executor = DatabaseExecutor(DB_EXECUTOR_WORKERS, DB_EXECUTOR_QUEUE_DEPTH)
+
+def _fetchone(conn: sqlite3.Connection, sql: str, params):
+    return conn.execute(sql, params).fetchone()
+
+def _fetchall(conn: sqlite3.Connection, sql: str, params):
+    return conn.execute(sql, params).fetchall()
+
+def _execute(conn: sqlite3.Connection, sql: str, params):
+    return conn.execute(sql, params)
+
+def _commit(conn: sqlite3.Connection):
+    conn.commit()
+
+_read_queue_wait = db_queue_wait_seconds.labels("read")
+_read_query_time = db_query_seconds.labels("read")
+
+def _timed_read(submitted: float, fn, conn: sqlite3.Connection, args):
+    started = time.perf_counter()
+    _read_queue_wait.observe(started - submitted)
+    try:
+        return fn(conn, *args)
+    finally:
+        _read_query_time.observe(time.perf_counter() - started)
+        if sql_profiler.enabled:
+            sql_profiler.finish(conn)
+
+class AsyncConnection:
+    """Awaitable facade over one pooled connection.
+
+    Every call runs on the database executor, so the event loop keeps serving
+    other requests while SQLite works. Calls on one AsyncConnection are
+    awaited one after another, so the underlying connection is never used by
+    two threads at once. The connection is checked out of the pool on first
+    use, so requests answered entirely from memory never touch the pool.
+    """
+
+    def __init__(self, pool: ConnectionPool, executor: DatabaseExecutor):
+        self.raw = None
+        self._pool = pool
+        self._executor = executor
+        self._pending = None
+
+    async def _connection(self) -> sqlite3.Connection:
+        if self.raw is None:
+            started = time.perf_counter()
+            conn = self._pool.acquire(block=False)
+            if conn is None:
+                try:
+                    conn = await run_in_threadpool(self._pool.acquire)
+                except PoolTimeoutError:
+                    raise DatabaseBusyError()
+            db_connection_wait_seconds.observe(time.perf_counter() - started)
+            self.raw = conn
+        return self.raw
+
+    async def run(self, fn, *args):
+        """Run ``fn(conn, *args)`` on the executor, e.g. a multi-statement transaction."""
+        conn = await self._connection()
+        self._pending = self._executor.submit(_timed_read, time.perf_counter(), fn, conn, args)
+        return await asyncio.wrap_future(self._pending)
+
+    async def fetchone(self, sql: str, params=()):
+        return await self.run(_fetchone, sql, params)
+
+    async def fetchall(self, sql: str, params=()):
+        return await self.run(_fetchall, sql, params)
+
+    async def execute(self, sql: str, params=()):
+        return await self.run(_execute, sql, params)
+
+    async def commit(self):
+        await self.run(_commit)
+
+    def release(self):
+        conn = self.raw
+        if conn is None:
+            return
+        self.raw = None
+        # If the awaiting request was cancelled the job may still be running;
+        # hand the connection back only once it has finished with it.
+        pending = self._pending
+        if pending is not None and not pending.done():
+            pending.add_done_callback(lambda _: self._pool.release(conn))
+        else:
+            self._pool.release(conn)
+
+async def get_db():
+    """Per-request database handle.
+
+    FastAPI caches dependencies per request, so the auth dependency and the
+    handler share this handle and at most one pooled connection.
+    """
+    db = AsyncConnection(db_pool, db_executor)
+    try:
+        yield db
+    finally:
+        db.release()
+
+# Table versions: every write to a versioned table bumps its counter in the
+# table_versions table, from a trigger in the same transaction, so the
+# counters cover writes from every worker and from the maintenance commands.
+# Cached results derived from a table are checked against a copy of the
+# counters held in this process: it is re-read after each of this process's
+# writer transactions, and otherwise whenever a versioned read finds it older
+# than TABLE_VERSIONS_MAX_AGE seconds (0 re-reads on every versioned read).
+TABLE_VERSIONS_MAX_AGE = float(os.getenv("TABLE_VERSIONS_MAX_AGE", "1"))
+
+class TableVersions:
+    def __init__(self, max_age: float):
+        self.max_age = max_age
+        self._versions = {}
+        self._loaded_at = None
+
+    def load(self, conn: sqlite3.Connection):
+        """Re-read the shared counters on ``conn``"""
+        loaded_at = time.monotonic()
+        versions = dict(self._versions)
+        # Counters only grow; a slower concurrent load must not move them back
+        for name, version in conn.execute("SELECT name, version FROM table_versions"):
+            versions[name] = max(version, versions.get(name, version))
+        self._versions = versions
+        self._loaded_at = loaded_at
+
+    async def refresh(self, db: AsyncConnection, max_age: Optional[float] = None):
+        """Re-read the counters on the request's connection if they are older than ``max_age``"""
+        max_age = self.max_age if max_age is None else max_age
+        if self._loaded_at is None or time.monotonic() - self._loaded_at >= max_age:
+            await db.run(self.load)
+
+    def key(self, tables) -> str:
+        """Compact version string covering ``tables``."""
+        return ".".join(str(self._versions.get(table, 0)) for table in tables)
+
+    def snapshot(self) -> dict:
+        return dict(self._versions)
+
+table_versions = TableVersions(TABLE_VERSIONS_MAX_AGE)
+
+_write_queue_wait = db_queue_wait_seconds.labels("write")
+_write_query_time = db_query_seconds.labels("write")
+
+class DatabaseWriter:
+    """Single background thread that performs every database write.
+
+    Requests hand it ``fn(conn, *args)`` and await the result. Whatever is
+    queued when the thread comes round is committed as one transaction
+    (group commit), each operation inside its own savepoint, so one failing
+    operation is rolled back and reported without affecting the others.
+    Results are delivered only after the commit.
+
+    Operations must not commit. ``exclusive`` operations are the exception:
+    they run on their own and manage their own transaction, for work with
+    side effects outside SQLite (material files) or bulk rebuilds.
+    """
+
+    _STOP = object()
+
+    def __init__(self, factory, queue_depth: int, batch_size: int, versions: TableVersions):
+        self._factory = factory
+        self._queue = queue.Queue(maxsize=queue_depth)
+        self._batch_size = batch_size
+        self._versions = versions
+        self._thread = None
+        self._lock = threading.Lock()
+        self.transactions = 0
+        self.operations = 0
+        self.failed_operations = 0
+        self.largest_batch = 0
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                    self._thread.start()
+
+    def submit(self, fn, *args, exclusive: bool = False) -> Future:
+        self._ensure_started()
+        future = Future()
+        try:
+            self._queue.put_nowait((fn, args, exclusive, future, time.perf_counter()))
+        except queue.Full:
+            raise DatabaseBusyError()
+        return future
+
+    async def run(self, fn, *args, exclusive: bool = False):
+        return await asyncio.wrap_future(self.submit(fn, *args, exclusive=exclusive))
+
+    def _publish_versions(self, conn: sqlite3.Connection):
+        try:
+            self._versions.load(conn)
+        except sqlite3.Error as e:
+            # Versioned reads still pick the write up once their copy expires
+            logger.warning(f"Could not re-read table versions: {e}")
+
+    def _run(self):
+        conn = self._factory()
+        pending = None
+        try:
+            while True:
+                op, pending = pending or self._queue.get(), None
+                if op is self._STOP:
+                    break
+                if op[2]:
+                    self._run_exclusive(conn, op)
+                    if sql_profiler.enabled:
+                        sql_profiler.finish(conn)
+                    continue
+                batch = [op]
+                while len(batch) < self._batch_size:
+                    try:
+                        op = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if op is self._STOP or op[2]:
+                        pending = op
+                        break
+                    batch.append(op)
+                self._commit_batch(conn, batch)
+                if sql_profiler.enabled:
+                    sql_profiler.finish(conn)
+        finally:
+            conn.close()
+
+    def _run_exclusive(self, conn: sqlite3.Connection, op):
+        fn, args, _, future, submitted = op
+        if not future.set_running_or_notify_cancel():
+            return
+        self.transactions += 1
+        self.operations += 1
+        started = time.perf_counter()
+        _write_queue_wait.observe(started - submitted)
+        try:
+            result = fn(conn, *args)
+        except BaseException as e:
+            error = e
+        else:
+            error = None
+        _write_query_time.observe(time.perf_counter() - started)
+        if conn.in_transaction:
+            conn.rollback()
+        # Re-read even after a failure: the operation may have committed part of its work
+        self._publish_versions(conn)
+        if error is not None:
+            self.failed_operations += 1
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _commit_batch(self, conn: sqlite3.Connection, batch):
+        # Requests cancelled while queued are dropped
+        batch = [op for op in batch if op[3].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        outcomes = []
+        started = time.perf_counter()
+        for op in batch:
+            _write_queue_wait.observe(started - op[4])
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, args, _, future, _ in batch:
+                conn.execute("SAVEPOINT write_op")
+                try:
+                    outcomes.append((future, None, fn(conn, *args)))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write_op")
+                    outcomes.append((future, e, None))
+                conn.execute("RELEASE write_op")
+            conn.commit()
+        except BaseException as e:
+            if conn.in_transaction:
+                conn.rollback()
+            for _, _, _, future, _ in batch:
+                future.set_exception(e)
+            self.failed_operations += len(batch)
+            return
+        finally:
+            _write_query_time.observe(time.perf_counter() - started)
+        
+        self._publish_versions(conn)
+        self.transactions += 1
+        self.operations += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        for future, error, result in outcomes:
+            if error is not None:
+                self.failed_operations += 1
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def shutdown(self):
+        if self._thread is not None:
+            self._queue.put(self._STOP)
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "transactions": self.transactions,
+            "operations": self.operations,
+            "failed_operations": self.failed_operations,
+            "largest_batch": self.largest_batch,
+            "operations_per_transaction": round(self.operations / self.transactions, 2) if self.transactions else 0.0,
+        }
+
+db_writer = DatabaseWriter(open_db_connection, DB_WRITER_QUEUE_DEPTH, DB_WRITER_BATCH_SIZE, table_versions)
+metrics.gauge_callback("db_writer_queued", "Write operations waiting for the writer thread", lambda: db_writer.stats()["queued"])
+
+class SingleFlight:
+    """Coalesces identical concurrent reads into one query.
+
+    A read is keyed by its function, arguments and the versions of the
+    tables it reads. The first caller runs it on its own request connection;
+    callers arriving while it is in flight await that execution without
+    touching the pool, and all of them receive the same result (or
+    exception), which must therefore not be mutated. If the first caller goes
+    away mid-read, a waiter runs the read itself. A commit to one of the
+    tables starts a fresh flight rather than joining one that may predate it.
+    """
+
+    def __init__(self, versions: TableVersions):
+        self._versions = versions
+        self._flights = {}  # key -> [future, waiters]
+        self.calls = 0
+        self.executions = 0
+        self.largest_fan_out = 0
+
+    async def run(self, db: AsyncConnection, tables, fn, *args):
+        """``fn(conn, *args)`` on ``db``, shared with identical concurrent calls"""
+        key = (self._versions.key(tables), fn, args)
+        self.calls += 1
+        while True:
+            flight = self._flights.get(key)
+            if flight is None:
+                break
+            flight[1] += 1
+            try:
+                return await asyncio.shield(flight[0])
+            except asyncio.CancelledError:
+                if not flight[0].cancelled() or asyncio.current_task().cancelling():
+                    raise
+                # The caller running it went away; take over (or join a newer flight)
+        
+        self.executions += 1
+        flight = [asyncio.get_running_loop().create_future(), 1]
+        self._flights[key] = flight
+        try:
+            result = await db.run(fn, *args)
+        except asyncio.CancelledError:
+            flight[0].cancel()
+            raise
+        except BaseException as e:
+            flight[0].set_exception(e)
+            raise
+        else:
+            flight[0].set_result(result)
+            return result
+        finally:
+            self._finish(key, flight)
+
+    async def fetchone(self, db: AsyncConnection, tables, sql: str, params=()):
+        return await self.run(db, tables, _fetchone, sql, tuple(params))
+
+    async def fetchall(self, db: AsyncConnection, tables, sql: str, params=()):
+        return await self.run(db, tables, _fetchall, sql, tuple(params))
+
+    def _finish(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        self.largest_fan_out = max(self.largest_fan_out, flight[1])
+        future = flight[0]
+        if not future.cancelled():
+            future.exception()  # retrieved even if nobody was waiting
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._flights),
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.calls - self.executions,
+            "largest_fan_out": self.largest_fan_out,
+            "coalescing_ratio": round(self.calls / self.executions, 2) if self.executions else 0.0,
+        }
+
+read_flights = SingleFlight(table_versions)
+
+# Practice buckets: finished sessions are summed per student, course and
+# calendar day / ISO week (Monday start, UTC), keyed by the session start.
+PRACTICE_BUCKET_EXPRESSIONS = {
+    "day": "date(start_time)",
+    "week": "date(start_time, '-6 days', 'weekday 1')",
+}
+
+def _practice_bucket_backfill_sql(granularity: str) -> str:
+    return f"""
+        INSERT INTO practice_buckets (user_id, granularity, bucket_start, course_id, total_seconds, session_count)
+        SELECT user_id, '{granularity}', {PRACTICE_BUCKET_EXPRESSIONS[granularity]}, course_id,
+               SUM(duration_seconds), COUNT(id)
+        FROM time_tracking
+        WHERE duration_seconds IS NOT NULL
+        GROUP BY 1, 3, 4
+    """
+
+def _table_version_triggers(table: str) -> List[str]:
+    """Triggers bumping ``table``'s row in table_versions on every insert, update and delete"""
+    return [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS tv_{table}_{event.lower()} AFTER {event} ON {table}
+        BEGIN
+            UPDATE table_versions SET version = version + 1 WHERE name = '{table}';
+        END
+        """ for event in ("INSERT", "UPDATE", "DELETE")
+    ]
+
+# Schema migrations. Each entry runs exactly once, in order, inside its own
+# transaction; the last applied version is stored in PRAGMA user_version.
+# Never edit a migration that has shipped - append a new one instead.
+MIGRATIONS = [
+    (1, "Initial schema", [
+        """
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             first_name TEXT,
@@ -96,18 +1442,16 @@ def init_db():
             is_admin BOOLEAN DEFAULT FALSE,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
-    """)
-    
-    conn.execute("""
+        """,
+        """
         CREATE TABLE IF NOT EXISTS courses (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT UNIQUE,
             description TEXT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
-    """)
-    
-    conn.execute("""
+        """,
+        """
         CREATE TABLE IF NOT EXISTS user_courses (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER,
@@ -116,9 +1460,8 @@ def init_db():
             FOREIGN KEY (user_id) REFERENCES users(id),
             FOREIGN KEY (course_id) REFERENCES courses(id)
         )
-    """)
-    
-    conn.execute("""
+        """,
+        """
         CREATE TABLE IF NOT EXISTS time_tracking (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER,
@@ -129,9 +1472,8 @@ def init_db():
             FOREIGN KEY (user_id) REFERENCES users(id),
             FOREIGN KEY (course_id) REFERENCES courses(id)
         )
-    """)
-    
-    conn.execute("""
+        """,
+        """
         CREATE TABLE IF NOT EXISTS course_materials (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             course_id INTEGER,
@@ -141,16 +1483,154 @@ def init_db():
             uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (course_id) REFERENCES courses(id)
         )
-    """)
+        """,
+    ]),
+    (2, "Indexes for access checks, active sessions and materials", [
+        # Keep the oldest row of any duplicated assignment before making the pair unique
+        """
+        DELETE FROM user_courses
+        WHERE id NOT IN (SELECT MIN(id) FROM user_courses GROUP BY user_id, course_id)
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_user_courses_user_course ON user_courses (user_id, course_id)",
+        "CREATE INDEX IF NOT EXISTS ix_user_courses_course ON user_courses (course_id)",
+        """
+        CREATE INDEX IF NOT EXISTS ix_time_tracking_active
+        ON time_tracking (user_id, start_time) WHERE end_time IS NULL
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_time_tracking_user_course ON time_tracking (user_id, course_id)",
+        "CREATE INDEX IF NOT EXISTS ix_course_materials_course ON course_materials (course_id)",
+    ]),
+    (3, "Size and checksum of uploaded materials", [
+        "ALTER TABLE course_materials ADD COLUMN size_bytes INTEGER",
+        "ALTER TABLE course_materials ADD COLUMN sha256 TEXT",
+    ]),
+    (4, "Reference-counted content-addressed material blobs", [
+        """
+        CREATE TABLE IF NOT EXISTS material_blobs (
+            sha256 TEXT PRIMARY KEY,
+            size_bytes INTEGER NOT NULL,
+            ref_count INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_course_materials_sha256 ON course_materials (sha256)",
+    ]),
+    (5, "Per-student, per-course progress rollup", [
+        """
+        CREATE TABLE IF NOT EXISTS progress_rollup (
+            user_id INTEGER NOT NULL,
+            course_id INTEGER NOT NULL,
+            total_seconds INTEGER NOT NULL DEFAULT 0,
+            session_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, course_id)
+        ) WITHOUT ROWID
+        """,
+        """
+        INSERT OR REPLACE INTO progress_rollup (user_id, course_id, total_seconds, session_count)
+        SELECT user_id, course_id, SUM(duration_seconds), COUNT(id)
+        FROM time_tracking
+        WHERE duration_seconds IS NOT NULL
+        GROUP BY user_id, course_id
+        """,
+    ]),
+    (6, "Daily and weekly practice buckets", [
+        """
+        CREATE TABLE IF NOT EXISTS practice_buckets (
+            user_id INTEGER NOT NULL,
+            granularity TEXT NOT NULL CHECK (granularity IN ('day', 'week')),
+            bucket_start DATE NOT NULL,
+            course_id INTEGER NOT NULL,
+            total_seconds INTEGER NOT NULL DEFAULT 0,
+            session_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, granularity, bucket_start, course_id)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_practice_buckets_range ON practice_buckets (granularity, bucket_start)",
+        *(_practice_bucket_backfill_sql(granularity) for granularity in PRACTICE_BUCKET_EXPRESSIONS),
+    ]),
+    (7, "Students by name for keyset pagination", [
+        "CREATE INDEX IF NOT EXISTS ix_users_students_by_name ON users (is_admin, first_name, last_name, id)",
+    ]),
+    (8, "Shared per-table write counters for cache validation", [
+        """
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        ) WITHOUT ROWID
+        """,
+        # Random starting points, so tags issued for another database never match
+        """
+        INSERT OR IGNORE INTO table_versions (name, version) VALUES
+            ('users', abs(random() % 1000000000)),
+            ('courses', abs(random() % 1000000000)),
+            ('user_courses', abs(random() % 1000000000)),
+            ('course_materials', abs(random() % 1000000000)),
+            ('progress_rollup', abs(random() % 1000000000))
+        """,
+        *(statement for table in ("users", "courses", "user_courses", "course_materials", "progress_rollup")
+          for statement in _table_version_triggers(table)),
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def migrate(conn: sqlite3.Connection):
+    """Bring the database up to SCHEMA_VERSION, applying only missing migrations."""
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        return
     
+    # BEGIN IMMEDIATE takes the write lock, so concurrent workers booting at the
+    # same time apply each migration once; re-read the version under the lock.
+    # Each migration commits on its own, so a failing one leaves the earlier
+    # ones applied and is retried on the next start.
+    for version, description, statements in MIGRATIONS:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if version <= conn.execute("PRAGMA user_version").fetchone()[0]:
+                conn.rollback()
+                continue
+            logger.info(f"Applying schema migration {version}: {description}")
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    conn.execute("PRAGMA optimize")
+
+# Initialize database tables
+def init_db():
+    with db_pool.connection() as conn:
+        migrate(conn)
+        _seed_defaults(conn)
+        table_versions.load(conn)
+
+def _seed_defaults(conn: sqlite3.Connection):
     # Insert admin users
     admin_users = [
         ("Shreya", "Srinivasan", "shreya.srinivasan2011@gmail.com", "Bo142315"),
         ("Jaya", "B", "jayab2021@gmail.com", "Admin@123")
     ]
+    courses = ["śravaṇaṃ", "Kirtanam", "Smaranam", "Pada Sevanam", "Archanam", "Vandanam"]
     
-    for first_name, last_name, email, password in admin_users:
-        password_hash = get_password_hash(password)
+    # Seeds are normally all present; hashing a password costs a noticeable
+    # slice of a cold start, so only missing rows are created
+    existing_emails = {row[0] for row in conn.execute(
+        "SELECT email FROM users WHERE email IN (SELECT value FROM json_each(?))",
+        (json.dumps([user[2] for user in admin_users]),)
+    )}
+    existing_courses = {row[0] for row in conn.execute(
+        "SELECT name FROM courses WHERE name IN (SELECT value FROM json_each(?))", (json.dumps(courses),)
+    )}
+    admin_users = [user for user in admin_users if user[2] not in existing_emails]
+    courses = [course for course in courses if course not in existing_courses]
+    if not admin_users and not courses:
+        return
+    
+    # Hashed in parallel on the password pool, never on the startup thread
+    password_hashes = password_hasher.hash_many_blocking([user[3] for user in admin_users]) if admin_users else []
+    for (first_name, last_name, email, _), password_hash in zip(admin_users, password_hashes):
         try:
             conn.execute(
                 "INSERT INTO users (first_name, last_name, email, password_hash, is_admin) VALUES (?, ?, ?, ?, ?)",
@@ -160,7 +1640,6 @@ def init_db():
             pass  # User already exists
     
     # Insert default courses
-    courses = ["śravaṇaṃ", "Kirtanam", "Smaranam", "Pada Sevanam", "Archanam", "Vandanam"]
     for course in courses:
         try:
             conn.execute("INSERT INTO courses (name) VALUES (?)", (course,))
@@ -168,7 +1647,6 @@ def init_db():
             pass  # Course already exists
     
     conn.commit()
-    conn.close()
 
 # Pydantic models
 class UserCreate(BaseModel):
@@ -204,25 +1682,139 @@ class TimeEntry(BaseModel):
     end_time: Optional[datetime] = None
     duration_seconds: Optional[int] = None
 
-# Error notification function
-async def send_error_notification(error_details: str):
-    try:
-        # Send SMS notification (you'll need to implement with Twilio or similar service)
-        # For now, just log the error
-        logger.error(f"Error notification: {error_details}")
-        
-        # You can implement email notification here using SMTP
-        # or SMS notification using Twilio API
-        
-    except Exception as e:
-        logger.error(f"Failed to send error notification: {str(e)}")
+class CourseAssignment(BaseModel):
+    user_id: int
+    course_id: int
+
+class BulkCourseAssignment(BaseModel):
+    assignments: List[CourseAssignment]
+
+# Password hashing
+PASSWORD_HASH_ROUNDS = int(os.getenv("PASSWORD_HASH_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+PASSWORD_HASH_QUEUE_DEPTH = int(os.getenv("PASSWORD_HASH_QUEUE_DEPTH", "32"))
+
+_LEGACY_SHA256_HASH = re.compile(r"^[0-9a-f]{64}$")
+_crypt_contexts = {}
+
+def _crypt_context(rounds: int):
+    context = _crypt_contexts.get(rounds)
+    if context is None:
+        # Imported here: only the hasher's worker processes load passlib
+        from passlib.context import CryptContext
+        context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=rounds)
+        _crypt_contexts[rounds] = context
+    return context
+
+def _hash_password(password: str, rounds: int) -> str:
+    return _crypt_context(rounds).hash(password)
+
+def _hash_passwords(passwords: List[str], rounds: int) -> List[str]:
+    context = _crypt_context(rounds)
+    return [context.hash(password) for password in passwords]
+
+def _verify_password(password: str, hashed_password: str, rounds: int):
+    """Return ``(valid, new_hash)``; ``new_hash`` is set when the stored hash should be replaced."""
+    if _LEGACY_SHA256_HASH.match(hashed_password):
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        if not hmac.compare_digest(legacy, hashed_password):
+            return False, None
+        return True, _hash_password(password, rounds)
+    return _crypt_context(rounds).verify_and_update(password, hashed_password)
+
+class PasswordHasherBusyError(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=503,
+            detail="Too many sign-ins at once, please retry",
+            headers={"Retry-After": "1"},
+        )
+
+class PasswordHasher:
+    """bcrypt hashing on a bounded process pool.
+
+    A bcrypt call costs hundreds of milliseconds of CPU, so it must not run
+    on the event loop. At most ``workers + queue_depth`` hashes may be running
+    or waiting; beyond that callers get a 503 rather than an ever-growing
+    queue. The pool is started on first use, through a forkserver: by then
+    the database and writer threads are running, and a plain fork could copy
+    a lock one of them holds into a worker that would then wait forever.
+    """
+
+    def __init__(self, workers: int, queue_depth: int, rounds: int):
+        self.rounds = rounds
+        self._workers = workers
+        self._slots = threading.BoundedSemaphore(workers + queue_depth)
+        self._executor = None
+        self._lock = threading.Lock()
 
-# Utility functions
-def verify_password(plain_password, hashed_password):
-    return hashlib.sha256(plain_password.encode()).hexdigest() == hashed_password
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # Imported on first use so starting the app does not load multiprocessing
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self._workers, mp_context=multiprocessing.get_context("forkserver")
+                )
+            return self._executor
 
-def get_password_hash(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusyError()
+        try:
+            future = self._pool().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return asyncio.wrap_future(future)
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(_hash_password, password, self.rounds)
+
+    def _slices(self, passwords: List[str]) -> List[List[str]]:
+        size = max(1, -(-len(passwords) // self._workers))
+        return [passwords[i:i + size] for i in range(0, len(passwords), size)]
+
+    async def hash_many(self, passwords: List[str], rounds: int) -> List[str]:
+        """Hash a batch at ``rounds``, split into one pool task per worker."""
+        parts = await asyncio.gather(*(self._submit(_hash_passwords, part, rounds) for part in self._slices(passwords)))
+        return [hashed for part in parts for hashed in part]
+
+    def hash_many_blocking(self, passwords: List[str]) -> List[str]:
+        """``hash_many`` at the configured rounds for synchronous callers (startup seeding)"""
+        parts = self._pool().map(_hash_passwords, self._slices(passwords), itertools.repeat(self.rounds))
+        return [hashed for part in parts for hashed in part]
+
+    async def verify(self, password: str, hashed_password: str):
+        """Check a password; see ``_verify_password`` for the return value."""
+        if not hashed_password:
+            return False, None
+        return await self._submit(_verify_password, password, hashed_password, self.rounds)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_DEPTH, PASSWORD_HASH_ROUNDS)
+
+async def authenticate_user(db: AsyncConnection, email: str, password: str) -> Optional[dict]:
+    """Return the user for valid credentials, upgrading an outdated stored hash on the way."""
+    db_user = await get_user_by_email(db, email)
+    if not db_user:
+        return None
+    valid, new_hash = await password_hasher.verify(password, db_user["password_hash"])
+    if not valid:
+        return None
+    if new_hash:
+        await db_writer.run(_update_password_hash, db_user["id"], new_hash)
+    return db_user
+
+def _update_password_hash(conn: sqlite3.Connection, user_id: int, password_hash: str):
+    conn.execute("UPDATE users SET password_hash = ? WHERE id = ?", (password_hash, user_id))
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -234,10 +1826,52 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_user_by_email(email: str):
-    conn = get_db_connection()
-    result = conn.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
-    conn.close()
+def issue_access_token(db_user: dict) -> str:
+    data = {
+        "sub": db_user["email"],
+        "jti": secrets.token_urlsafe(12),
+        "ver": token_revocations.current_version(db_user["id"]),
+    }
+    if AUTH_TOKEN_MODE == "claims":
+        data.update({
+            "uid": db_user["id"],
+            "role": "admin" if db_user["is_admin"] else "student",
+            "given_name": db_user["first_name"],
+            "family_name": db_user["last_name"],
+        })
+    return create_access_token(data, expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+
+def principal_from_claims(payload: dict) -> Optional[dict]:
+    """Build the current user from a claims token, or None if it was revoked."""
+    user_id = payload.get("uid")
+    if token_revocations.is_revoked(payload.get("jti")):
+        return None
+    if payload.get("ver", 0) < token_revocations.current_version(user_id):
+        return None
+    return {
+        "id": user_id,
+        "first_name": payload.get("given_name"),
+        "last_name": payload.get("family_name"),
+        "email": payload["sub"],
+        "is_admin": payload.get("role") == "admin",
+    }
+
+def _load_principal(conn: sqlite3.Connection, email: str) -> Optional[dict]:
+    row = conn.execute(
+        "SELECT id, first_name, last_name, email, is_admin FROM users WHERE email = ?", (email,)
+    ).fetchone()
+    if row is None:
+        return None
+    return {
+        "id": row["id"],
+        "first_name": row["first_name"],
+        "last_name": row["last_name"],
+        "email": row["email"],
+        "is_admin": bool(row["is_admin"])
+    }
+
+async def get_user_by_email(db: AsyncConnection, email: str):
+    result = await db.fetchone("SELECT * FROM users WHERE email = ?", (email,))
     
     if result:
         return {
@@ -250,7 +1884,7 @@ def get_user_by_email(email: str):
         }
     return None
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncConnection = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -264,10 +1898,27 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise credentials_exception
     
-    user = get_user_by_email(email)
+    if token_revocations.is_revoked(payload.get("jti")):
+        raise credentials_exception
+    
+    if AUTH_TOKEN_MODE == "claims" and "uid" in payload:
+        user = principal_from_claims(payload)
+        if user is None:
+            raise credentials_exception
+        return user
+    
+    user = principal_cache.get(email)
     if user is None:
+        # Concurrent misses for one user (a page firing several calls at
+        # once) share a single lookup, run on the first caller's connection
+        generation = principal_cache.generation
+        user = await read_flights.run(db, ("users",), _load_principal, email)
+        if user is None:
+            raise credentials_exception
+        principal_cache.set(email, user, generation)
+    if payload.get("ver", 0) < token_revocations.current_version(user["id"]):
         raise credentials_exception
-    return user
+    return dict(user)
 
 async def get_current_admin(current_user: dict = Depends(get_current_user)):
     if not current_user.get("is_admin"):
@@ -277,17 +1928,924 @@ async def get_current_admin(current_user: dict = Depends(get_current_user)):
         )
     return current_user
 
+# Request profiling: a request from an admin carrying "X-Profile: 1", or a
+# PROFILE_SAMPLE_RATE share of all requests, runs under cProfile from routing
+# through dependency resolution, the handler and response serialization.
+# Profiles are pstats files kept in a ring of the newest PROFILE_KEEP under
+# PROFILE_DIR (PROFILE_KEEP=0 turns profiling off); the response's
+# X-Profile-Id names the file. cProfile watches the event loop thread, so
+# requests running at the same time show up too, and database calls appear
+# as time awaiting the executor.
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_REQUEST_HEADER = b"x-profile"
+PROFILE_ID_HEADER = b"x-profile-id"
+
+_PROFILE_ID = re.compile(r"^[0-9a-f]{12}-[0-9a-f]{6}$")
+
+class ProfileStore:
+    """Bounded on-disk ring of request profiles, each a .prof and a .json file"""
+
+    def __init__(self, directory: str, keep: int):
+        self.directory = directory
+        self.keep = keep
+
+    @staticmethod
+    def new_id() -> str:
+        # Millisecond timestamp first, so ids sort oldest to newest
+        return f"{int(time.time() * 1000):012x}-{secrets.token_hex(3)}"
+
+    def save(self, profile_id: str, profiler, meta: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        profiler.dump_stats(os.path.join(self.directory, f"{profile_id}.prof"))
+        with open(os.path.join(self.directory, f"{profile_id}.json"), "w") as f:
+            json.dump(meta, f)
+        ids = self._ids()
+        for old_id in ids[:max(len(ids) - self.keep, 0)]:
+            for suffix in (".json", ".prof"):
+                with suppress(FileNotFoundError):
+                    os.remove(os.path.join(self.directory, old_id + suffix))
+
+    def _ids(self) -> List[str]:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-5] for name in names if name.endswith(".prof") and _PROFILE_ID.match(name[:-5]))
+
+    def list(self) -> List[dict]:
+        profiles = []
+        for profile_id in reversed(self._ids()):
+            with suppress(FileNotFoundError, ValueError):
+                with open(os.path.join(self.directory, f"{profile_id}.json")) as f:
+                    profiles.append({"id": profile_id, **json.load(f)})
+        return profiles
+
+    def path(self, profile_id: str) -> Optional[str]:
+        if not _PROFILE_ID.match(profile_id):
+            return None
+        path = os.path.join(self.directory, f"{profile_id}.prof")
+        return path if os.path.exists(path) else None
+
+profile_store = ProfileStore(PROFILE_DIR, PROFILE_KEEP)
+
+async def _is_admin_token(authorization: str) -> bool:
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    db = AsyncConnection(db_pool, db_executor)
+    try:
+        user = await get_current_user(token, db)
+    except HTTPException:
+        return False
+    finally:
+        db.release()
+    return bool(user.get("is_admin"))
+
+class ProfilingMiddleware:
+    """Runs selected requests under cProfile; one at a time, as cProfile is per thread.
+
+    An unprofiled request costs a scan of its header names and, with
+    sampling on, one random number.
+    """
+
+    def __init__(self, app, store: ProfileStore, sample_rate: float):
+        self.app = app
+        self.store = store
+        self.sample_rate = sample_rate
+        self._active = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self._active or self.store.keep <= 0:
+            await self.app(scope, receive, send)
+            return
+        
+        requested = any(name == PROFILE_REQUEST_HEADER for name, _ in scope["headers"])
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if requested and not sampled:
+            headers = dict(scope["headers"])
+            requested = (
+                headers.get(PROFILE_REQUEST_HEADER) == b"1"
+                and await _is_admin_token(headers.get(b"authorization", b"").decode("latin-1"))
+            )
+        if not (requested or sampled) or self._active:
+            await self.app(scope, receive, send)
+            return
+        
+        self._active = True
+        profile_id = self.store.new_id()
+        status_code = 500
+        
+        async def send_with_profile_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (PROFILE_ID_HEADER, profile_id.encode())]}
+            await send(message)
+        
+        import cProfile  # only loaded once a request is actually profiled
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profiler.disable()
+            self._active = False
+            meta = {
+                "at": datetime.utcnow().isoformat(timespec="seconds"),
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": getattr(scope.get("route"), "path", None),
+                "status": status_code,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+                "trigger": "sample" if sampled else "header",
+            }
+            try:
+                await run_in_threadpool(self.store.save, profile_id, profiler, meta)
+            except Exception as e:
+                logger.error(f"Failed to store profile {profile_id}: {str(e)}")
+
+app.add_middleware(ProfilingMiddleware, store=profile_store, sample_rate=PROFILE_SAMPLE_RATE)
+
+# Material files are stored once per distinct content under
+# uploads/blobs/<aa>/<bb>/<sha256> and shared by every course_materials row
+# with that checksum; material_blobs.ref_count tracks how many rows use each.
+_blob_lock = threading.Lock()  # serializes publishing and garbage-collecting blob files
+
+def blob_path(sha256: str) -> str:
+    return f"{UPLOAD_DIR}/blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+def publish_material(conn: sqlite3.Connection, course_id: int, material_type: str, filename: str, staged: StagedUpload) -> dict:
+    """Record a material row and make sure its blob exists; an exclusive writer operation.
+
+    If the content is already stored, the staged file is discarded and only
+    metadata is written.
+    """
+    path = blob_path(staged.sha256)
+    with _blob_lock:
+        try:
+            cursor = conn.execute(
+                "INSERT INTO course_materials (course_id, material_type, filename, file_path, size_bytes, sha256) VALUES (?, ?, ?, ?, ?, ?)",
+                (course_id, material_type, filename, path, staged.size_bytes, staged.sha256)
+            )
+            material_id = cursor.lastrowid
+            conn.execute("""
+                INSERT INTO material_blobs (sha256, size_bytes, ref_count) VALUES (?, ?, 1)
+                ON CONFLICT(sha256) DO UPDATE SET ref_count = ref_count + 1
+            """, (staged.sha256, staged.size_bytes))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        
+        deduplicated = os.path.exists(path)
+        if deduplicated:
+            discard_staged_file(staged.temp_path)
+        else:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(staged.temp_path, path)
+            except OSError:
+                _delete_material_locked(conn, material_id)
+                raise
+    return {"id": material_id, "file_path": path, "deduplicated": deduplicated}
+
+def delete_material(conn: sqlite3.Connection, material_id: int) -> bool:
+    """Delete a material row and garbage-collect its file once nothing references it."""
+    with _blob_lock:
+        return _delete_material_locked(conn, material_id)
+
+def _delete_material_locked(conn: sqlite3.Connection, material_id: int) -> bool:
+    unreferenced_path = None
+    try:
+        material = conn.execute(
+            "SELECT file_path, sha256 FROM course_materials WHERE id = ?", (material_id,)
+        ).fetchone()
+        if material is None:
+            conn.rollback()
+            return False
+        conn.execute("DELETE FROM course_materials WHERE id = ?", (material_id,))
+        
+        if material["sha256"] and material["file_path"] == blob_path(material["sha256"]):
+            conn.execute(
+                "UPDATE material_blobs SET ref_count = ref_count - 1 WHERE sha256 = ?", (material["sha256"],)
+            )
+            deleted = conn.execute(
+                "DELETE FROM material_blobs WHERE sha256 = ? AND ref_count <= 0", (material["sha256"],)
+            ).rowcount
+            if deleted:
+                unreferenced_path = material["file_path"]
+        else:
+            # Pre-blob-store upload stored under its own name
+            still_used = conn.execute(
+                "SELECT 1 FROM course_materials WHERE file_path = ? LIMIT 1", (material["file_path"],)
+            ).fetchone()
+            if not still_used:
+                unreferenced_path = material["file_path"]
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    
+    if unreferenced_path:
+        discard_staged_file(unreferenced_path)
+    return True
+
+# Material downloads
+MATERIAL_URL_TTL_SECONDS = int(os.getenv("MATERIAL_URL_TTL_SECONDS", str(6 * 60 * 60)))
+MATERIAL_CACHE_MAX_AGE = int(os.getenv("MATERIAL_CACHE_MAX_AGE", "3600"))
+
+_URL_TOKEN = re.compile(r"(\btoken=)[^&\s\"']+")
+
+def material_download_url(material_id: int, user: dict) -> str:
+    """Signed URL for <audio>/<a> tags, which cannot send an Authorization header.
+
+    The issue and expiry times are snapped to window boundaries, so the URL
+    (and with it the browser's cache entry) stays the same across page loads
+    within a window. The link names the user, not their role, and carries
+    their token version, so revoking the user's tokens revokes it too.
+    """
+    window = MATERIAL_URL_TTL_SECONDS
+    issued = int(time.time()) // window * window
+    token = jwt.encode(
+        {
+            "typ": "material",
+            "mid": material_id,
+            "uid": user["id"],
+            "ver": token_revocations.current_version(user["id"]),
+            "iat": issued,
+            "exp": issued + 2 * window,
+        },
+        SECRET_KEY,
+        algorithm=ALGORITHM,
+    )
+    return f"/api/materials/{material_id}/content?token={token}"
+
+def redact_url_tokens(text: str) -> str:
+    """Hide signed ``token=`` query values before a URL is logged or sent in an alert."""
+    return _URL_TOKEN.sub(r"\1[redacted]", text)
+
+class RedactUrlTokensFilter(logging.Filter):
+    """Keep signed download tokens out of the uvicorn access log."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if isinstance(record.args, tuple):
+            record.args = tuple(redact_url_tokens(arg) if isinstance(arg, str) else arg for arg in record.args)
+        return True
+
+logging.getLogger("uvicorn.access").addFilter(RedactUrlTokensFilter())
+
+def parse_byte_range(header: Optional[str], size: int):
+    """Parse a single ``bytes=`` range into inclusive ``(start, end)``.
+
+    Returns None when the whole file should be sent (no header, an invalid
+    range such as ``bytes=500-100``, or a form we do not serve such as
+    multiple ranges) and raises 416 when no byte of the file is in range.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[6:].strip().partition("-")
+    if not (first or last) or any(part and not part.isdigit() for part in (first, last)):
+        return None
+    if first:
+        start = int(first)
+        end = int(last) if last else size - 1
+        if last and start > end:
+            return None  # invalid, so ignored (RFC 9110 14.1.1)
+    else:
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start >= size:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, min(end, size - 1)
+
+class RangeFileResponse(Response):
+    """Send ``count`` bytes of a file starting at ``offset`` without loading it into memory.
+
+    Uses the ASGI zero-copy extension (sendfile) when the server offers it and
+    otherwise streams fixed-size chunks read with ``os.pread``.
+    """
+
+    chunk_size = 256 * 1024
+
+    def __init__(self, path: str, offset: int, count: int, status_code: int, headers: dict, media_type: str):
+        self.path = path
+        self.offset = offset
+        self.count = count
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.init_headers(headers)
+        self.headers["content-length"] = str(count)
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"] == "HEAD" or self.count == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        
+        f = await run_in_threadpool(open, self.path, "rb")
+        try:
+            if "http.response.zerocopy" in scope.get("extensions", {}):
+                await send({"type": "http.response.zerocopy", "file": f, "offset": self.offset, "count": self.count})
+                return
+            offset, remaining = self.offset, self.count
+            while remaining > 0:
+                chunk = await run_in_threadpool(os.pread, f.fileno(), min(self.chunk_size, remaining), offset)
+                if not chunk:
+                    break
+                offset += len(chunk)
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # File shrank underneath us; end the response rather than hang
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            await run_in_threadpool(f.close)
+
+def material_file_response(request: Request, file_path: str, filename: str, sha256: Optional[str]) -> Response:
+    try:
+        st = os.stat(file_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Material file not found")
+    
+    etag = f'"{sha256}"' if sha256 else f'"{int(st.st_mtime):x}-{st.st_size:x}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+        "Cache-Control": f"private, max-age={MATERIAL_CACHE_MAX_AGE}",
+        "Accept-Ranges": "bytes",
+    }
+    
+    # Conditional GET: If-None-Match wins over If-Modified-Since
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+            return Response(status_code=304, headers=headers)
+    elif request.headers.get("if-modified-since"):
+        try:
+            since = parsedate_to_datetime(request.headers["if-modified-since"]).timestamp()
+            if int(st.st_mtime) <= since:
+                return Response(status_code=304, headers=headers)
+        except (TypeError, ValueError):
+            pass
+    
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if if_range is None or if_range.strip() == etag:
+        byte_range = parse_byte_range(request.headers.get("range"), st.st_size)
+    
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    headers["Content-Disposition"] = f"inline; filename*=UTF-8''{quote(filename)}"
+    if byte_range is None:
+        return RangeFileResponse(file_path, 0, st.st_size, 200, headers, media_type)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+    return RangeFileResponse(file_path, start, end - start + 1, 206, headers, media_type)
+
+def safe_filename(filename: Optional[str]) -> str:
+    name = os.path.basename((filename or "").replace("\\", "/")).strip()
+    if name in ("", ".", ".."):
+        raise HTTPException(status_code=400, detail="Invalid file name")
+    return name
+
+# Progress rollup: progress_rollup holds SUM(duration_seconds) and COUNT(*)
+# of finished sessions per (user, course), maintained in the same transaction
+# that finishes a session, so /progress never has to scan time_tracking.
+_RAW_PROGRESS_SQL = """
+    SELECT user_id, course_id, SUM(duration_seconds) AS total_seconds, COUNT(id) AS session_count
+    FROM time_tracking
+    WHERE duration_seconds IS NOT NULL
+    GROUP BY user_id, course_id
+"""
+
+def add_session_to_rollup(conn: sqlite3.Connection, session_id: int,
+                          seconds: Optional[int] = None, sessions: int = 1):
+    """Fold one just-finished session into progress_rollup; caller commits.
+
+    A session that keeps growing (see HeartbeatBuffer) is added once with
+    its duration so far, then by ``seconds`` more with ``sessions=0``.
+    """
+    conn.execute("""
+        INSERT INTO progress_rollup (user_id, course_id, total_seconds, session_count)
+        SELECT user_id, course_id, COALESCE(?, duration_seconds), ?
+        FROM time_tracking
+        WHERE id = ? AND duration_seconds IS NOT NULL
+        ON CONFLICT (user_id, course_id) DO UPDATE SET
+            total_seconds = total_seconds + excluded.total_seconds,
+            session_count = session_count + excluded.session_count
+    """, (seconds, sessions, session_id))
+
+def rebuild_progress_rollup(conn: sqlite3.Connection) -> int:
+    """Recompute progress_rollup from the raw sessions; returns the number of rows."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM progress_rollup")
+        conn.execute(f"""
+            INSERT INTO progress_rollup (user_id, course_id, total_seconds, session_count)
+            SELECT user_id, course_id, total_seconds, session_count FROM ({_RAW_PROGRESS_SQL})
+        """)
+        rows = conn.execute("SELECT COUNT(*) FROM progress_rollup").fetchone()[0]
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return rows
+
+def check_progress_rollup(conn: sqlite3.Connection) -> List[dict]:
+    """Compare progress_rollup with the raw aggregate and list every difference."""
+    mismatches = conn.execute(f"""
+        WITH raw AS ({_RAW_PROGRESS_SQL})
+        SELECT raw.user_id, raw.course_id,
+               raw.total_seconds AS raw_total_seconds, raw.session_count AS raw_session_count,
+               p.total_seconds AS rollup_total_seconds, p.session_count AS rollup_session_count
+        FROM raw
+        LEFT JOIN progress_rollup p ON p.user_id = raw.user_id AND p.course_id = raw.course_id
+        WHERE p.user_id IS NULL
+           OR p.total_seconds != raw.total_seconds
+           OR p.session_count != raw.session_count
+        UNION ALL
+        SELECT p.user_id, p.course_id, NULL, NULL, p.total_seconds, p.session_count
+        FROM progress_rollup p
+        WHERE NOT EXISTS (SELECT 1 FROM raw WHERE raw.user_id = p.user_id AND raw.course_id = p.course_id)
+    """).fetchall()
+    return [dict(row) for row in mismatches]
+
+# Practice buckets (see PRACTICE_BUCKET_EXPRESSIONS)
+PRACTICE_RANGE_LIMITS = {"day": 366, "week": 104}
+PRACTICE_DEFAULT_RANGE = {"day": 30, "week": 12}
+
+def add_session_to_buckets(conn: sqlite3.Connection, session_id: int,
+                           seconds: Optional[int] = None, sessions: int = 1):
+    """Fold one just-finished session into its day and week buckets; caller commits.
+
+    ``seconds`` and ``sessions`` work as in add_session_to_rollup.
+    """
+    for granularity, bucket_expression in PRACTICE_BUCKET_EXPRESSIONS.items():
+        conn.execute(f"""
+            INSERT INTO practice_buckets (user_id, granularity, bucket_start, course_id, total_seconds, session_count)
+            SELECT user_id, ?, {bucket_expression}, course_id, COALESCE(?, duration_seconds), ?
+            FROM time_tracking
+            WHERE id = ? AND duration_seconds IS NOT NULL
+            ON CONFLICT (user_id, granularity, bucket_start, course_id) DO UPDATE SET
+                total_seconds = total_seconds + excluded.total_seconds,
+                session_count = session_count + excluded.session_count
+        """, (granularity, seconds, sessions, session_id))
+
+def backfill_practice_buckets(conn: sqlite3.Connection) -> int:
+    """Recompute every practice bucket from the raw sessions; returns the number of rows."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM practice_buckets")
+        for granularity in PRACTICE_BUCKET_EXPRESSIONS:
+            conn.execute(_practice_bucket_backfill_sql(granularity))
+        rows = conn.execute("SELECT COUNT(*) FROM practice_buckets").fetchone()[0]
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return rows
+
+def bucket_floor(day: date, granularity: str) -> date:
+    """Start of the bucket containing ``day``."""
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    return day
+
+def _fetch_practice_buckets(conn: sqlite3.Connection, granularity: str, start: date, end: date,
+                            user_id: Optional[int], course_id: Optional[int]):
+    conditions = ["b.granularity = ?", "b.bucket_start BETWEEN ? AND ?"]
+    params = [granularity, start.isoformat(), end.isoformat()]
+    if user_id is not None:
+        conditions.append("b.user_id = ?")
+        params.append(user_id)
+    if course_id is not None:
+        conditions.append("b.course_id = ?")
+        params.append(course_id)
+    return _fetchall(conn, f"""
+        SELECT b.user_id, b.course_id, c.name AS course_name, b.bucket_start,
+               b.total_seconds, b.session_count
+        FROM practice_buckets b
+        JOIN courses c ON c.id = b.course_id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY b.user_id, b.bucket_start, b.course_id
+    """, tuple(params))
+
+# Keyset pagination: list endpoints return one page ordered by a unique sort
+# key, and the key of its last row comes back as an opaque cursor in the
+# X-Next-Cursor header. The next page seeks strictly past that key through an
+# index, so every page costs the same however deep the client scrolls.
+PAGE_DEFAULT_LIMIT = int(os.getenv("PAGE_DEFAULT_LIMIT", "100"))
+PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", "1000"))
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(key: list) -> str:
+    raw = json.dumps(key, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, size: int) -> list:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        key = None
+    if not isinstance(key, list) or len(key) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return key
+
+def check_page_limit(limit: Optional[int], cursor: Optional[str]) -> Optional[int]:
+    """The page size for a listing, or None for the whole listing.
+
+    Callers that send neither ``limit`` nor ``cursor`` get every row, as
+    before the listings were paginated; a cursor alone pages at
+    PAGE_DEFAULT_LIMIT.
+    """
+    if limit is None:
+        return PAGE_DEFAULT_LIMIT if cursor else None
+    if not 1 <= limit <= PAGE_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {PAGE_MAX_LIMIT}")
+    return limit
+
+def parse_fields(fields: Optional[str], allowed: List[str]) -> List[str]:
+    """Resolve a comma-separated ``fields=`` projection against the allowed names."""
+    if not fields:
+        return list(allowed)
+    selected = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in selected if name not in allowed]
+    if unknown or not selected:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}; expected some of: {', '.join(allowed)}"
+        )
+    return selected
+
+def like_prefix(prefix: str) -> str:
+    escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "%"
+
+def _fetch_page(conn: sqlite3.Connection, select_sql: str, conditions: List[str], params: list,
+                key_columns: List[str], after: Optional[list], limit: int):
+    """Run ``select_sql`` for one page, or every row when ``limit`` is None; returns (rows, has_more)."""
+    if after is not None:
+        conditions = conditions + [f"({', '.join(key_columns)}) > ({', '.join('?' * len(key_columns))})"]
+        params = params + after
+    rows = conn.execute(f"""
+        {select_sql}
+        WHERE {' AND '.join(conditions)}
+        ORDER BY {', '.join(key_columns)}
+        LIMIT ?
+    """, (*params, -1 if limit is None else limit + 1)).fetchall()  # -1: no limit
+    if limit is None:
+        return rows, False
+    return rows[:limit], len(rows) > limit
+
+def set_next_cursor(response: Response, rows, has_more: bool, key_fields: List[str]):
+    if has_more:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor([rows[-1][name] for name in key_fields])
+
+# Conditional GET: read endpoints tag their response with an ETag built from
+# the versions of the tables they read (see TableVersions), the caller's scope
+# and the query string. A request whose If-None-Match carries that tag gets
+# 304 Not Modified before the tables are queried; a commit to any of them, by
+# any process, changes the tag. "no-cache" makes browsers revalidate every time.
+VERSIONED_CACHE_CONTROL = "private, no-cache"
+
+async def versioned_etag(request: Request, db: AsyncConnection, tables, *scope, max_age: Optional[float] = None) -> str:
+    await table_versions.refresh(db, max_age)
+    key = "|".join([table_versions.key(tables), request.url.path, request.url.query, *map(str, scope)])
+    return f'"{hashlib.sha256(key.encode()).hexdigest()[:32]}"'
+
+def not_modified(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """304 response if the client already holds ``etag``, else tag ``response`` with it"""
+    headers = {"ETag": etag, "Cache-Control": VERSIONED_CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        # Weak comparison; "*" is not honoured, as it would skip the access checks
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        if etag in tags:
+            return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+# Exports: rows are read in keyset pages of EXPORT_BATCH_ROWS and streamed
+# into the response body as they arrive, so memory stays flat however large
+# the table is. Each page is one executor call on a connection held only for
+# that call, so a slow download never pins a pooled connection; the export is
+# not a single snapshot, but every row is sent once, in key order.
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "1000"))
+EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+EXPORT_DATASETS = {  # name -> (select without WHERE/ORDER BY, unique key columns)
+    "sessions": ("""
+        SELECT t.id, t.user_id, u.email, t.course_id, c.name AS course_name,
+               t.start_time, t.end_time, t.duration_seconds
+        FROM time_tracking t
+        JOIN users u ON u.id = t.user_id
+        JOIN courses c ON c.id = t.course_id
+    """, ["t.id"]),
+    "assignments": ("""
+        SELECT uc.user_id, u.email, u.first_name, u.last_name,
+               uc.course_id, c.name AS course_name, uc.assigned_at
+        FROM user_courses uc
+        JOIN users u ON u.id = uc.user_id
+        JOIN courses c ON c.id = uc.course_id
+    """, ["uc.user_id", "uc.course_id"]),
+    "progress": ("""
+        SELECT p.user_id, u.email, u.first_name, u.last_name,
+               p.course_id, c.name AS course_name, p.total_seconds, p.session_count
+        FROM progress_rollup p
+        JOIN users u ON u.id = p.user_id
+        JOIN courses c ON c.id = p.course_id
+    """, ["p.user_id", "p.course_id"]),
+}
+
+def _export_page(conn: sqlite3.Connection, dataset: str, after: Optional[list]):
+    """One page of ``dataset`` after the key ``after``; returns (columns, rows)."""
+    select_sql, key_columns = EXPORT_DATASETS[dataset]
+    keys = ", ".join(key_columns)
+    where = f"WHERE ({keys}) > ({', '.join('?' * len(key_columns))})" if after else ""
+    cursor = conn.execute(f"{select_sql} {where} ORDER BY {keys} LIMIT ?", (*(after or ()), EXPORT_BATCH_ROWS))
+    return [column[0] for column in cursor.description], cursor.fetchall()
+
+class ExportEncoder:
+    """Turns pages of rows into CSV or NDJSON bytes, optionally gzipped."""
+
+    def __init__(self, fmt: str, compress: bool):
+        self.fmt = fmt
+        # wbits=31 writes a gzip container rather than a bare zlib stream
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator="\n")
+
+    def header(self, columns: List[str]) -> bytes:
+        return self._encode(self._csv([columns]) if self.fmt == "csv" else "")
+
+    def rows(self, columns: List[str], rows: list) -> bytes:
+        if self.fmt == "csv":
+            return self._encode(self._csv(rows))
+        return self._encode("".join(
+            json.dumps(dict(zip(columns, row)), ensure_ascii=False, separators=(",", ":")) + "\n"
+            for row in rows
+        ))
+
+    def flush(self) -> bytes:
+        return self._compressor.flush() if self._compressor else b""
+
+    def _csv(self, rows) -> str:
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self._writer.writerows(rows)
+        return self._buffer.getvalue()
+
+    def _encode(self, text: str) -> bytes:
+        data = text.encode("utf-8")
+        return self._compressor.compress(data) if self._compressor else data
+
+async def export_stream(dataset: str, fmt: str, compress: bool):
+    """Yield the encoded export of ``dataset``, one keyset page per chunk.
+
+    The first chunk (the CSV header, if any) is produced once the first page
+    has been read, so errors before it still reach the client as a status.
+    """
+    key_fields = [column.split(".")[-1] for column in EXPORT_DATASETS[dataset][1]]
+    encoder = ExportEncoder(fmt, compress)
+    after = None
+    while True:
+        db = AsyncConnection(db_pool, db_executor)
+        try:
+            columns, rows = await db.run(_export_page, dataset, after)
+        finally:
+            db.release()
+        if after is None:
+            yield encoder.header(columns)
+        if rows:
+            yield await run_in_threadpool(encoder.rows, columns, rows)
+        if len(rows) < EXPORT_BATCH_ROWS:
+            break
+        after = [rows[-1][field] for field in key_fields]
+    yield encoder.flush()
+
+# Heartbeats: while a course page is open the client pings every
+# HEARTBEAT_INTERVAL_SECONDS. Pings only touch an in-memory buffer; a
+# background task writes the buffered sessions to time_tracking in one
+# transaction every HEARTBEAT_FLUSH_SECONDS, and once more on shutdown.
+# A session ends with a final ping or after HEARTBEAT_TIMEOUT_SECONDS of
+# silence, and lasts from its first ping to its last.
+HEARTBEAT_INTERVAL_SECONDS = int(os.getenv("HEARTBEAT_INTERVAL_SECONDS", "30"))
+HEARTBEAT_TIMEOUT_SECONDS = int(os.getenv("HEARTBEAT_TIMEOUT_SECONDS", str(3 * HEARTBEAT_INTERVAL_SECONDS)))
+HEARTBEAT_FLUSH_SECONDS = int(os.getenv("HEARTBEAT_FLUSH_SECONDS", "10"))
+HEARTBEAT_MAX_SESSIONS = int(os.getenv("HEARTBEAT_MAX_SESSIONS", "50000"))
+
+def _utc_timestamp(epoch: float) -> str:
+    """Format like SQLite's CURRENT_TIMESTAMP."""
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(epoch))
+
+class HeartbeatSession:
+    __slots__ = ("user_id", "course_id", "started", "last_seen", "row_id", "recorded_seconds")
+
+    def __init__(self, user_id: int, course_id: int, now: float):
+        self.user_id = user_id
+        self.course_id = course_id
+        self.started = now
+        self.last_seen = now
+        self.row_id = None  # time_tracking row, once flushed
+        self.recorded_seconds = 0
+
+    @property
+    def seconds(self) -> int:
+        return int(self.last_seen - self.started)
+
+class HeartbeatBuffer:
+    """In-memory heartbeat sessions, written to SQLite in batches.
+
+    Only the event loop touches the buffer. Each flushed session is one
+    time_tracking row: inserted on its first flush, then updated with the
+    new end time, with progress_rollup and practice_buckets moved by the
+    difference in the same transaction.
+    """
+
+    def __init__(self, timeout: float, flush_interval: float, max_sessions: int):
+        self._timeout = timeout
+        self._flush_interval = flush_interval
+        self._max_sessions = max_sessions
+        self._sessions = {}  # (user_id, course_id) -> HeartbeatSession
+        self._closing = []   # ended sessions waiting for their last flush
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self.pings = 0
+        self.flushes = 0
+        self.rows_inserted = 0
+        self.rows_updated = 0
+        self.flush_errors = 0
+
+    def is_active(self, user_id: int, course_id: int) -> bool:
+        session = self._sessions.get((user_id, course_id))
+        return session is not None and time.time() - session.last_seen <= self._timeout
+
+    def ping(self, user_id: int, course_id: int, final: bool = False) -> int:
+        """Record a heartbeat and return the session's length in seconds."""
+        now = time.time()
+        key = (user_id, course_id)
+        session = self._sessions.get(key)
+        if session is not None and now - session.last_seen > self._timeout:
+            self._closing.append(self._sessions.pop(key))
+            session = None
+        if session is None:
+            if final:
+                return 0
+            if len(self._sessions) >= self._max_sessions:
+                raise HTTPException(status_code=503, detail="Server is busy, please retry")
+            session = self._sessions[key] = HeartbeatSession(user_id, course_id, now)
+        session.last_seen = now
+        self.pings += 1
+        if final:
+            self._closing.append(self._sessions.pop(key))
+        return session.seconds
+
+    async def flush(self, final: bool = False) -> int:
+        """Write every changed session; with ``final`` end all of them. Returns rows written."""
+        async with self._flush_lock:
+            now = time.time()
+            for key, session in list(self._sessions.items()):
+                if final or now - session.last_seen > self._timeout:
+                    self._closing.append(self._sessions.pop(key))
+            closing, self._closing = self._closing, []
+            
+            batch = [
+                (session, session.seconds)
+                for session in itertools.chain(closing, self._sessions.values())
+                if session.row_id is None or session.seconds != session.recorded_seconds
+            ]
+            if not batch:
+                return 0
+            writes = [
+                (session.row_id, session.user_id, session.course_id, session.started,
+                 session.started + seconds, seconds, seconds - session.recorded_seconds)
+                for session, seconds in batch
+            ]
+            try:
+                row_ids = await db_writer.run(self._write_batch, writes)
+            except BaseException:
+                self.flush_errors += 1
+                self._closing[:0] = closing
+                raise
+            
+            for (session, seconds), row_id in zip(batch, row_ids):
+                if session.row_id is None:
+                    self.rows_inserted += 1
+                else:
+                    self.rows_updated += 1
+                session.row_id = row_id
+                session.recorded_seconds = seconds
+            self.flushes += 1
+            return len(batch)
+
+    @staticmethod
+    def _write_batch(conn: sqlite3.Connection, writes) -> List[int]:
+        row_ids = []
+        for row_id, user_id, course_id, started, ended, seconds, delta in writes:
+            if row_id is None:
+                row_id = conn.execute("""
+                    INSERT INTO time_tracking (user_id, course_id, start_time, end_time, duration_seconds)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (user_id, course_id, _utc_timestamp(started), _utc_timestamp(ended), seconds)).lastrowid
+                add_session_to_rollup(conn, row_id)
+                add_session_to_buckets(conn, row_id)
+            else:
+                conn.execute(
+                    "UPDATE time_tracking SET end_time = ?, duration_seconds = ? WHERE id = ?",
+                    (_utc_timestamp(ended), seconds, row_id)
+                )
+                add_session_to_rollup(conn, row_id, seconds=delta, sessions=0)
+                add_session_to_buckets(conn, row_id, seconds=delta, sessions=0)
+            row_ids.append(row_id)
+        return row_ids
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._flush_periodically())
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Heartbeat flush failed: {str(e)}")
+
+    async def stop(self):
+        if self._task is not None:
+            # Cancel only between flushes, never while one is being written
+            async with self._flush_lock:
+                self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        await self.flush(final=True)
+
+    def stats(self) -> dict:
+        return {
+            "active_sessions": len(self._sessions),
+            "closing_sessions": len(self._closing),
+            "pings": self.pings,
+            "flushes": self.flushes,
+            "rows_inserted": self.rows_inserted,
+            "rows_updated": self.rows_updated,
+            "flush_errors": self.flush_errors,
+        }
+
+heartbeat_buffer = HeartbeatBuffer(HEARTBEAT_TIMEOUT_SECONDS, HEARTBEAT_FLUSH_SECONDS, HEARTBEAT_MAX_SESSIONS)
+
+# Cold start: time spent importing this module and initialising the
+# database, logged on every start and checked against a budget. For a
+# per-module breakdown run ``python -X importtime main.py``.
+COLD_START_BUDGET_SECONDS = float(os.getenv("COLD_START_BUDGET_SECONDS", "2.0"))
+startup_report = {"import_seconds": None, "init_db_seconds": None, "budget_seconds": COLD_START_BUDGET_SECONDS}
+
+def report_cold_start():
+    total = (startup_report["import_seconds"] or 0) + (startup_report["init_db_seconds"] or 0)
+    startup_report["total_seconds"] = round(total, 3)
+    startup_report["within_budget"] = total <= COLD_START_BUDGET_SECONDS
+    message = (
+        f"Cold start took {total:.3f}s (import {startup_report['import_seconds']}s, "
+        f"init_db {startup_report['init_db_seconds']}s, budget {COLD_START_BUDGET_SECONDS}s)"
+    )
+    if startup_report["within_budget"]:
+        logger.info(message)
+    else:
+        logger.warning(message)
+
 # Initialize database on startup
 @app.on_event("startup")
 async def startup_event():
+    error_notifier.start()
+    started = time.perf_counter()
     init_db()
+    startup_report["init_db_seconds"] = round(time.perf_counter() - started, 3)
+    report_cold_start()
+    heartbeat_buffer.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    try:
+        await heartbeat_buffer.stop()
+    except Exception as e:
+        logger.error(f"Final heartbeat flush failed: {str(e)}")
+    await error_notifier.stop()
+    db_writer.shutdown()
+    password_hasher.shutdown()
+    db_executor.shutdown()
+    db_pool.close_all()
 
 # API Routes
 @api_router.post("/register", response_model=dict)
-async def register(user: UserCreate):
+async def register(user: UserCreate, db: AsyncConnection = Depends(get_db)):
     try:
         # Check if user already exists
-        existing_user = get_user_by_email(user.email)
+        existing_user = await get_user_by_email(db, user.email)
         if existing_user:
             raise HTTPException(
                 status_code=400,
@@ -295,39 +2853,41 @@ async def register(user: UserCreate):
             )
         
         # Create new user
-        password_hash = get_password_hash(user.password)
-        conn = get_db_connection()
-        conn.execute(
-            "INSERT INTO users (first_name, last_name, email, password_hash) VALUES (?, ?, ?, ?)",
-            (user.first_name, user.last_name, user.email, password_hash)
-        )
-        conn.commit()
-        conn.close()
+        password_hash = await password_hasher.hash(user.password)
+        await db_writer.run(_insert_user, user.first_name, user.last_name, user.email, password_hash)
+        invalidate_user(user.email)
         
         return {"message": "User registered successfully"}
     
+    except HTTPException:
+        raise
+    except sqlite3.IntegrityError:
+        # Lost a race with a concurrent registration of the same email
+        raise HTTPException(status_code=400, detail="Email already registered")
     except Exception as e:
         error_msg = f"Registration error: {str(e)}"
         await send_error_notification(error_msg)
         raise HTTPException(status_code=500, detail="Registration failed")
 
+def _insert_user(conn: sqlite3.Connection, first_name: str, last_name: str, email: str, password_hash: str):
+    conn.execute(
+        "INSERT INTO users (first_name, last_name, email, password_hash) VALUES (?, ?, ?, ?)",
+        (first_name, last_name, email, password_hash)
+    )
+
 @api_router.post("/token", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncConnection = Depends(get_db)):
     """OAuth2 compatible token endpoint"""
     try:
-        db_user = get_user_by_email(form_data.username)  # OAuth2 uses username field for email
-        if not db_user or not verify_password(form_data.password, db_user["password_hash"]):
+        db_user = await authenticate_user(db, form_data.username, form_data.password)  # OAuth2 uses username field for email
+        if not db_user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect email or password",
                 headers={"WWW-Authenticate": "Bearer"},
             )
         
-        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        access_token = create_access_token(
-            data={"sub": db_user["email"]}, 
-            expires_delta=access_token_expires
-        )
+        access_token = issue_access_token(db_user)
         return {"access_token": access_token, "token_type": "bearer"}
     except HTTPException:
         raise
@@ -336,19 +2896,16 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
         raise HTTPException(status_code=500, detail="Login failed")
 
 @api_router.post("/login", response_model=Token)
-async def login(user: UserLogin):
+async def login(user: UserLogin, db: AsyncConnection = Depends(get_db)):
     try:
-        db_user = get_user_by_email(user.email)
-        if not db_user or not verify_password(user.password, db_user["password_hash"]):
+        db_user = await authenticate_user(db, user.email, user.password)
+        if not db_user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect email or password"
             )
         
-        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        access_token = create_access_token(
-            data={"sub": db_user["email"]}, expires_delta=access_token_expires
-        )
+        access_token = issue_access_token(db_user)
         
         return {"access_token": access_token, "token_type": "bearer"}
     
@@ -363,131 +2920,499 @@ async def login(user: UserLogin):
 async def get_current_user_info(current_user: dict = Depends(get_current_user)):
     return User(**current_user)
 
+@api_router.post("/logout")
+async def logout(token: str = Depends(oauth2_scheme), current_user: dict = Depends(get_current_user)):
+    payload = jwt.get_unverified_claims(token)  # already verified by get_current_user
+    if payload.get("jti"):
+        token_revocations.revoke(payload["jti"], payload["exp"])
+    return {"message": "Logged out successfully"}
+
+@api_router.post("/admin/users/{user_id}/revoke-tokens")
+async def revoke_user_tokens(user_id: int, admin: dict = Depends(get_current_admin), db: AsyncConnection = Depends(get_db)):
+    """Invalidate every token issued to a user, e.g. after a role change"""
+    try:
+        user = await db.fetchone("SELECT email FROM users WHERE id = ?", (user_id,))
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        version = token_revocations.bump_version(user_id)
+        invalidate_user(user["email"])
+        
+        return {"message": "Tokens revoked", "token_version": version}
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        error_msg = f"Revoke tokens error: {str(e)}"
+        await send_error_notification(error_msg)
+        raise HTTPException(status_code=500, detail="Failed to revoke tokens")
+
+@api_router.get("/metrics", include_in_schema=False)
+async def get_metrics(request: Request):
+    """Prometheus text exposition; set METRICS_TOKEN to require it as a bearer token"""
+    if METRICS_TOKEN:
+        expected = f"Bearer {METRICS_TOKEN}"
+        if not hmac.compare_digest(request.headers.get("authorization", ""), expected):
+            raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@api_router.get("/admin/profiles")
+async def list_profiles(admin: dict = Depends(get_current_admin)):
+    """Stored request profiles, newest first"""
+    profiles = await run_in_threadpool(profile_store.list)
+    return {"keep": profile_store.keep, "sample_rate": PROFILE_SAMPLE_RATE, "profiles": profiles}
+
+def _profile_text(path: str, limit: int) -> str:
+    import pstats
+    out = io.StringIO()
+    pstats.Stats(path, stream=out).sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
+
+@api_router.get("/admin/profiles/{profile_id}")
+async def download_profile(profile_id: str, format: str = "prof", limit: int = 60, admin: dict = Depends(get_current_admin)):
+    """A stored profile as a pstats file (``format=prof``) or a cumulative-time report (``format=text``)"""
+    path = profile_store.path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "prof":
+        return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
+    if format == "text":
+        return Response(await run_in_threadpool(_profile_text, path, max(1, min(limit, 500))), media_type="text/plain")
+    raise HTTPException(status_code=400, detail="format must be prof or text")
+
+@api_router.get("/admin/sql-profile")
+async def get_sql_profile(limit: int = 20, admin: dict = Depends(get_current_admin)):
+    """Statement fingerprints by total time, with plans for slow ones (needs SQL_PROFILE=1)"""
+    return sql_profiler.report(max(1, min(limit, 200)))
+
+@api_router.delete("/admin/sql-profile")
+async def reset_sql_profile(admin: dict = Depends(get_current_admin)):
+    sql_profiler.reset()
+    return {"message": "SQL profile reset"}
+
+@api_router.get("/admin/cache-stats")
+async def get_cache_stats(admin: dict = Depends(get_current_admin)):
+    return {
+        "principal_cache": principal_cache.stats(),
+        "token_revocations": token_revocations.stats(),
+        "heartbeats": heartbeat_buffer.stats(),
+        "writer": db_writer.stats(),
+        "table_versions": table_versions.snapshot(),
+        "read_coalescing": read_flights.stats(),
+        "startup": startup_report,
+        "notifications": error_notifier.stats(),
+    }
+
 @api_router.get("/courses")
-async def get_courses(current_user: dict = Depends(get_current_user)):
+async def get_courses(request: Request, response: Response, current_user: dict = Depends(get_current_user), db: AsyncConnection = Depends(get_db)):
     try:
-        conn = get_db_connection()
+        if current_user["is_admin"]:
+            etag = await versioned_etag(request, db, ("courses",), "admin")
+        else:
+            etag = await versioned_etag(request, db, ("courses", "user_courses"), current_user["id"])
+        unchanged = not_modified(request, response, etag)
+        if unchanged:
+            return unchanged
         
         if current_user["is_admin"]:
             # Admin sees all courses
-            courses = conn.execute("SELECT * FROM courses").fetchall()
+            courses = await read_flights.fetchall(db, ("courses",), "SELECT * FROM courses")
         else:
             # Students see only assigned courses
-            courses = conn.execute("""
+            courses = await read_flights.fetchall(db, ("courses", "user_courses"), """
                 SELECT c.* FROM courses c
                 JOIN user_courses uc ON c.id = uc.course_id
                 WHERE uc.user_id = ?
-            """, (current_user["id"],)).fetchall()
+            """, (current_user["id"],))
         
-        conn.close()
         return [{"id": c["id"], "name": c["name"], "description": c["description"]} for c in courses]
     
+    except HTTPException:
+        raise
     except Exception as e:
         error_msg = f"Get courses error: {str(e)}"
         await send_error_notification(error_msg)
         raise HTTPException(status_code=500, detail="Failed to fetch courses")
 
 @api_router.post("/assign-course")
-async def assign_course(user_id: int, course_id: int, admin: dict = Depends(get_current_admin)):
+async def assign_course(user_id: int, course_id: int, admin: dict = Depends(get_current_admin), db: AsyncConnection = Depends(get_db)):
     try:
-        conn = get_db_connection()
-        
         # Check if assignment already exists
-        existing = conn.execute(
+        existing = await db.fetchone(
             "SELECT * FROM user_courses WHERE user_id = ? AND course_id = ?",
             (user_id, course_id)
-        ).fetchone()
+        )
         
         if existing:
-            conn.close()
             raise HTTPException(status_code=400, detail="Course already assigned to user")
         
-        conn.execute(
-            "INSERT INTO user_courses (user_id, course_id) VALUES (?, ?)",
-            (user_id, course_id)
+        await db_writer.run(
+            _execute, "INSERT INTO user_courses (user_id, course_id) VALUES (?, ?)", (user_id, course_id)
         )
-        conn.commit()
-        conn.close()
         
         return {"message": "Course assigned successfully"}
     
     except HTTPException:
         raise
+    except sqlite3.IntegrityError:
+        # Lost a race with a concurrent assignment of the same pair
+        raise HTTPException(status_code=400, detail="Course already assigned to user")
     except Exception as e:
         error_msg = f"Course assignment error: {str(e)}"
         await send_error_notification(error_msg)
         raise HTTPException(status_code=500, detail="Failed to assign course")
 
 @api_router.delete("/unassign-course")
-async def unassign_course(user_id: int, course_id: int, admin: dict = Depends(get_current_admin)):
+async def unassign_course(user_id: int, course_id: int, admin: dict = Depends(get_current_admin), db: AsyncConnection = Depends(get_db)):
     try:
-        conn = get_db_connection()
-        conn.execute(
-            "DELETE FROM user_courses WHERE user_id = ? AND course_id = ?",
-            (user_id, course_id)
+        await db_writer.run(
+            _execute, "DELETE FROM user_courses WHERE user_id = ? AND course_id = ?", (user_id, course_id)
         )
-        conn.commit()
-        conn.close()
         
         return {"message": "Course unassigned successfully"}
     
+    except HTTPException:
+        raise
     except Exception as e:
         error_msg = f"Course unassignment error: {str(e)}"
         await send_error_notification(error_msg)
         raise HTTPException(status_code=500, detail="Failed to unassign course")
 
+BULK_ASSIGNMENT_MAX_ITEMS = int(os.getenv("BULK_ASSIGNMENT_MAX_ITEMS", "10000"))
+
+def _unique_pairs(request: BulkCourseAssignment) -> List[tuple]:
+    if len(request.assignments) > BULK_ASSIGNMENT_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_ASSIGNMENT_MAX_ITEMS} assignments per request")
+    return list(dict.fromkeys((item.user_id, item.course_id) for item in request.assignments))
+
+def _existing_assignments(conn: sqlite3.Connection, pairs: List[tuple]) -> set:
+    user_ids = json.dumps(sorted({user_id for user_id, _ in pairs}))
+    rows = conn.execute(
+        "SELECT user_id, course_id FROM user_courses WHERE user_id IN (SELECT value FROM json_each(?))",
+        (user_ids,)
+    ).fetchall()
+    return {(row["user_id"], row["course_id"]) for row in rows}
+
+def _bulk_assign(conn: sqlite3.Connection, pairs: List[tuple]) -> List[dict]:
+    """Assign every valid pair in one statement batch; returns a status per pair.
+
+    Only student ids are accepted; admin and missing ids are reported as
+    ``unknown_student``. The older single-pair /assign-course keeps its
+    original contract and does not check the user or course.
+    """
+    students = {row["id"] for row in conn.execute(
+        "SELECT id FROM users WHERE is_admin = 0 AND id IN (SELECT value FROM json_each(?))",
+        (json.dumps(sorted({user_id for user_id, _ in pairs})),)
+    )}
+    courses = {row["id"] for row in conn.execute(
+        "SELECT id FROM courses WHERE id IN (SELECT value FROM json_each(?))",
+        (json.dumps(sorted({course_id for _, course_id in pairs})),)
+    )}
+    existing = _existing_assignments(conn, pairs)
+    
+    results = []
+    for user_id, course_id in pairs:
+        if user_id not in students:
+            outcome = "unknown_student"
+        elif course_id not in courses:
+            outcome = "unknown_course"
+        elif (user_id, course_id) in existing:
+            outcome = "already_assigned"
+        else:
+            outcome = "assigned"
+        results.append({"user_id": user_id, "course_id": course_id, "status": outcome})
+    
+    conn.executemany(
+        "INSERT OR IGNORE INTO user_courses (user_id, course_id) VALUES (?, ?)",
+        [(r["user_id"], r["course_id"]) for r in results if r["status"] == "assigned"]
+    )
+    return results
+
+def _bulk_unassign(conn: sqlite3.Connection, pairs: List[tuple]) -> List[dict]:
+    """Remove every listed pair in one statement batch; returns a status per pair."""
+    existing = _existing_assignments(conn, pairs)
+    results = [
+        {"user_id": user_id, "course_id": course_id,
+         "status": "unassigned" if (user_id, course_id) in existing else "not_assigned"}
+        for user_id, course_id in pairs
+    ]
+    conn.executemany(
+        "DELETE FROM user_courses WHERE user_id = ? AND course_id = ?",
+        [(r["user_id"], r["course_id"]) for r in results if r["status"] == "unassigned"]
+    )
+    return results
+
+def _bulk_summary(results: List[dict]) -> dict:
+    summary = {}
+    for result in results:
+        summary[result["status"]] = summary.get(result["status"], 0) + 1
+    return {"summary": summary, "results": results}
+
+@api_router.post("/assign-courses")
+async def assign_courses(request: BulkCourseAssignment, admin: dict = Depends(get_current_admin)):
+    """Assign many (user, course) pairs in one transaction"""
+    try:
+        pairs = _unique_pairs(request)
+        results = await db_writer.run(_bulk_assign, pairs) if pairs else []
+        return _bulk_summary(results)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        error_msg = f"Bulk course assignment error: {str(e)}"
+        await send_error_notification(error_msg)
+        raise HTTPException(status_code=500, detail="Failed to assign courses")
+
+@api_router.post("/unassign-courses")
+async def unassign_courses(request: BulkCourseAssignment, admin: dict = Depends(get_current_admin)):
+    """Remove many (user, course) pairs in one transaction"""
+    try:
+        pairs = _unique_pairs(request)
+        results = await db_writer.run(_bulk_unassign, pairs) if pairs else []
+        return _bulk_summary(results)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        error_msg = f"Bulk course unassignment error: {str(e)}"
+        await send_error_notification(error_msg)
+        raise HTTPException(status_code=500, detail="Failed to unassign courses")
+
+# Student import: a roster CSV with email, first_name, last_name and password
+# columns and an optional "courses" column of course ids or names separated
+# by ";". Rows are parsed, validated, hashed and written IMPORT_CHUNK_ROWS at
+# a time, each chunk in one transaction; bad rows are reported and skipped,
+# and undecodable CSV ends the import with a report of what was committed.
+# Initial passwords are hashed at the full PASSWORD_HASH_ROUNDS, like any
+# other account, in parallel across the hasher pool's workers; an imported
+# student may never log in, so a cheaper hash would never be upgraded.
+IMPORT_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "1000"))
+IMPORT_REQUIRED_COLUMNS = ["email", "first_name", "last_name", "password"]
+IMPORT_MAX_REPORTED_ERRORS = 1000
+
+def _parse_import_chunk(reader: csv.DictReader, course_keys: dict, seen_emails: set, limit: int):
+    """Read and validate up to ``limit`` rows; returns (rows read, valid rows, errors, stopped).
+
+    A row that cannot be decoded or parsed as CSV ends the import: it is
+    reported as an error, ``stopped`` is set, and the rows before it are
+    still returned so they can be imported.
+    """
+    valid, errors, read = [], [], 0
+    while True:
+        try:
+            row = next(reader, None)
+        except (csv.Error, UnicodeDecodeError) as e:
+            errors.append({"line": reader.line_num, "email": None, "error": f"Unreadable CSV after line {reader.line_num}, import stopped: {str(e)}"})
+            return read, valid, errors, True
+        if row is None:
+            break
+        read += 1
+        line = reader.line_num
+        try:
+            user = UserCreate(
+                first_name=(row.get("first_name") or "").strip(),
+                last_name=(row.get("last_name") or "").strip(),
+                email=(row.get("email") or "").strip(),
+                password=row.get("password") or "",
+            )
+            if not (user.first_name and user.last_name and user.password):
+                raise ValueError("first_name, last_name and password are required")
+            if user.email in seen_emails:
+                raise ValueError("Email appears more than once in the file")
+            course_ids = []
+            for key in filter(None, (part.strip() for part in (row.get("courses") or "").split(";"))):
+                course_id = course_keys.get(key.lower())
+                if course_id is None:
+                    raise ValueError(f"Unknown course {key!r}")
+                course_ids.append(course_id)
+        except ValidationError as e:
+            errors.append({"line": line, "email": row.get("email"), "error": "; ".join(
+                f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()
+            )})
+        except ValueError as e:
+            errors.append({"line": line, "email": row.get("email"), "error": str(e)})
+        else:
+            seen_emails.add(user.email)
+            valid.append({"line": line, "user": user, "course_ids": list(dict.fromkeys(course_ids))})
+        if read >= limit:
+            break
+    return read, valid, errors, False
+
+def _import_students_chunk(conn: sqlite3.Connection, rows: List[dict]) -> dict:
+    """Insert one chunk of validated students and their assignments."""
+    existing = {row["email"] for row in conn.execute(
+        "SELECT email FROM users WHERE email IN (SELECT value FROM json_each(?))",
+        (json.dumps([row["email"] for row in rows]),)
+    )}
+    new_rows = [row for row in rows if row["email"] not in existing]
+    conn.executemany(
+        "INSERT INTO users (first_name, last_name, email, password_hash) VALUES (?, ?, ?, ?)",
+        [(row["first_name"], row["last_name"], row["email"], row["password_hash"]) for row in new_rows]
+    )
+    user_ids = {row["email"]: row["id"] for row in conn.execute(
+        "SELECT id, email FROM users WHERE email IN (SELECT value FROM json_each(?))",
+        (json.dumps([row["email"] for row in new_rows]),)
+    )}
+    assignments = [(user_ids[row["email"]], course_id) for row in new_rows for course_id in row["course_ids"]]
+    conn.executemany("INSERT OR IGNORE INTO user_courses (user_id, course_id) VALUES (?, ?)", assignments)
+    return {
+        "imported": [row["email"] for row in new_rows],
+        "assignments": len(assignments),
+        "duplicates": [row for row in rows if row["email"] in existing],
+    }
+
+@api_router.post("/admin/import-students")
+async def import_students(file: UploadFile = File(...), admin: dict = Depends(get_current_admin), db: AsyncConnection = Depends(get_db)):
+    """Import a roster CSV, optionally assigning courses"""
+    text = None
+    try:
+        courses = await db.fetchall("SELECT id, name FROM courses")
+        course_keys = {str(course["id"]): course["id"] for course in courses}
+        course_keys.update({course["name"].lower(): course["id"] for course in courses})
+        
+        # Starlette has already spooled the upload; read it back incrementally
+        text = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+        reader = csv.DictReader(text)
+        try:
+            columns = await run_in_threadpool(lambda: reader.fieldnames) or []
+        except (csv.Error, UnicodeDecodeError) as e:
+            raise HTTPException(status_code=400, detail=f"Unreadable CSV: {str(e)}")
+        missing = [column for column in IMPORT_REQUIRED_COLUMNS if column not in columns]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Missing CSV columns: {', '.join(missing)}")
+        
+        report = {"rows": 0, "imported": 0, "assignments": 0, "failed": 0, "errors": []}
+        
+        def add_errors(errors: List[dict]):
+            report["failed"] += len(errors)
+            room = IMPORT_MAX_REPORTED_ERRORS - len(report["errors"])
+            report["errors"].extend(errors[:max(room, 0)])
+        
+        seen_emails = set()
+        stopped = False
+        while not stopped:
+            # Earlier chunks are already committed, so an unreadable row ends
+            # the import with a partial report rather than an error response
+            read, valid, errors, stopped = await run_in_threadpool(
+                _parse_import_chunk, reader, course_keys, seen_emails, IMPORT_CHUNK_ROWS
+            )
+            report["rows"] += read
+            add_errors(errors)
+            
+            # Skip hashing rows that are certain to be rejected; the writer
+            # checks again for accounts registered in the meantime
+            registered = {row["email"] for row in await db.fetchall(
+                "SELECT email FROM users WHERE email IN (SELECT value FROM json_each(?))",
+                (json.dumps([row["user"].email for row in valid]),)
+            )} if valid else set()
+            add_errors([
+                {"line": row["line"], "email": row["user"].email, "error": "Email already registered"}
+                for row in valid if row["user"].email in registered
+            ])
+            valid = [row for row in valid if row["user"].email not in registered]
+            if not valid:
+                if not read:
+                    break
+                continue
+            
+            hashes = await password_hasher.hash_many(
+                [row["user"].password for row in valid], password_hasher.rounds
+            )
+            rows = [
+                {
+                    "line": row["line"],
+                    "first_name": row["user"].first_name,
+                    "last_name": row["user"].last_name,
+                    "email": row["user"].email,
+                    "password_hash": password_hash,
+                    "course_ids": row["course_ids"],
+                }
+                for row, password_hash in zip(valid, hashes)
+            ]
+            result = await db_writer.run(_import_students_chunk, rows)
+            
+            for email in result["imported"]:
+                invalidate_user(email)
+            report["imported"] += len(result["imported"])
+            report["assignments"] += result["assignments"]
+            add_errors([
+                {"line": row["line"], "email": row["email"], "error": "Email already registered"}
+                for row in result["duplicates"]
+            ])
+        
+        return report
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        error_msg = f"Student import error: {str(e)}"
+        await send_error_notification(error_msg)
+        raise HTTPException(status_code=500, detail="Failed to import students")
+    finally:
+        if text is not None:
+            text.detach()
+
+STUDENT_FIELDS = ["id", "first_name", "last_name", "email"]
+STUDENT_KEY_FIELDS = ["first_name", "last_name", "id"]
+
 @api_router.get("/students")
-async def get_students(admin: dict = Depends(get_current_admin)):
+async def get_students(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    course_id: Optional[int] = None,
+    name: Optional[str] = None,
+    fields: Optional[str] = None,
+    admin: dict = Depends(get_current_admin),
+    db: AsyncConnection = Depends(get_db)
+):
     try:
-        conn = get_db_connection()
-        students = conn.execute(
-            "SELECT id, first_name, last_name, email FROM users WHERE is_admin = 0"
-        ).fetchall()
-        conn.close()
+        unchanged = not_modified(request, response, await versioned_etag(request, db, ("users", "user_courses")))
+        if unchanged:
+            return unchanged
         
-        return [
-            {
-                "id": s["id"],
-                "first_name": s["first_name"],
-                "last_name": s["last_name"],
-                "email": s["email"]
-            } for s in students
-        ]
+        limit = check_page_limit(limit, cursor)
+        selected = parse_fields(fields, STUDENT_FIELDS)
+        after = decode_cursor(cursor, len(STUDENT_KEY_FIELDS)) if cursor else None
+        
+        conditions, params = ["is_admin = 0"], []
+        if course_id is not None:
+            conditions.append("EXISTS (SELECT 1 FROM user_courses uc WHERE uc.user_id = users.id AND uc.course_id = ?)")
+            params.append(course_id)
+        if name:
+            conditions.append("(first_name LIKE ? ESCAPE '\\' OR last_name LIKE ? ESCAPE '\\')")
+            params += [like_prefix(name)] * 2
+        
+        students, has_more = await db.run(
+            _fetch_page, "SELECT id, first_name, last_name, email FROM users",
+            conditions, params, STUDENT_KEY_FIELDS, after, limit
+        )
+        set_next_cursor(response, students, has_more, STUDENT_KEY_FIELDS)
+        
+        return [{field: s[field] for field in selected} for s in students]
     
+    except HTTPException:
+        raise
     except Exception as e:
         error_msg = f"Get students error: {str(e)}"
         await send_error_notification(error_msg)
         raise HTTPException(status_code=500, detail="Failed to fetch students")
 
 @api_router.post("/time-tracking/start")
-async def start_time_tracking(course_id: int, current_user: dict = Depends(get_current_user)):
+async def start_time_tracking(course_id: int, current_user: dict = Depends(get_current_user), db: AsyncConnection = Depends(get_db)):
     try:
-        conn = get_db_connection()
-        
         # Check if user has access to this course
         if not current_user["is_admin"]:
-            assigned = conn.execute(
+            assigned = await db.fetchone(
                 "SELECT * FROM user_courses WHERE user_id = ? AND course_id = ?",
                 (current_user["id"], course_id)
-            ).fetchone()
+            )
             
             if not assigned:
-                conn.close()
                 raise HTTPException(status_code=403, detail="Course not assigned to user")
         
-        # End any existing active session
-        conn.execute(
-            "UPDATE time_tracking SET end_time = CURRENT_TIMESTAMP WHERE user_id = ? AND end_time IS NULL",
-            (current_user["id"],)
-        )
-        
-        # Start new session
-        conn.execute(
-            "INSERT INTO time_tracking (user_id, course_id, start_time) VALUES (?, ?, CURRENT_TIMESTAMP)",
-            (current_user["id"], course_id)
-        )
-        conn.commit()
-        conn.close()
+        await db_writer.run(_start_session, current_user["id"], course_id)
         
         return {"message": "Time tracking started"}
     
@@ -498,30 +3423,55 @@ async def start_time_tracking(course_id: int, current_user: dict = Depends(get_c
         await send_error_notification(error_msg)
         raise HTTPException(status_code=500, detail="Failed to start time tracking")
 
-@api_router.post("/time-tracking/stop")
-async def stop_time_tracking(current_user: dict = Depends(get_current_user)):
+def _start_session(conn: sqlite3.Connection, user_id: int, course_id: int):
+    # End any existing active session
+    conn.execute(
+        "UPDATE time_tracking SET end_time = CURRENT_TIMESTAMP WHERE user_id = ? AND end_time IS NULL",
+        (user_id,)
+    )
+    
+    # Start new session
+    conn.execute(
+        "INSERT INTO time_tracking (user_id, course_id, start_time) VALUES (?, ?, CURRENT_TIMESTAMP)",
+        (user_id, course_id)
+    )
+
+@api_router.post("/time-tracking/heartbeat")
+async def time_tracking_heartbeat(course_id: int, final: bool = False, current_user: dict = Depends(get_current_user), db: AsyncConnection = Depends(get_db)):
     try:
-        conn = get_db_connection()
+        # Access is checked when a session begins, not on every ping
+        if not current_user["is_admin"] and not heartbeat_buffer.is_active(current_user["id"], course_id):
+            assigned = await db.fetchone(
+                "SELECT 1 FROM user_courses WHERE user_id = ? AND course_id = ?",
+                (current_user["id"], course_id)
+            )
+            if not assigned:
+                raise HTTPException(status_code=403, detail="Course not assigned to user")
+        
+        session_seconds = heartbeat_buffer.ping(current_user["id"], course_id, final)
         
+        return {"session_seconds": session_seconds, "interval_seconds": HEARTBEAT_INTERVAL_SECONDS}
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        error_msg = f"Heartbeat error: {str(e)}"
+        await send_error_notification(error_msg)
+        raise HTTPException(status_code=500, detail="Failed to record heartbeat")
+
+@api_router.post("/time-tracking/stop")
+async def stop_time_tracking(current_user: dict = Depends(get_current_user), db: AsyncConnection = Depends(get_db)):
+    try:
         # Find active session
-        active_session = conn.execute(
+        active_session = await db.fetchone(
             "SELECT * FROM time_tracking WHERE user_id = ? AND end_time IS NULL ORDER BY start_time DESC LIMIT 1",
             (current_user["id"],)
-        ).fetchone()
+        )
         
         if not active_session:
-            conn.close()
             raise HTTPException(status_code=404, detail="No active time tracking session")
         
-        # Calculate duration and update
-        conn.execute("""
-            UPDATE time_tracking 
-            SET end_time = CURRENT_TIMESTAMP,
-                duration_seconds = (strftime('%s', CURRENT_TIMESTAMP) - strftime('%s', start_time))
-            WHERE id = ?
-        """, (active_session["id"],))
-        conn.commit()
-        conn.close()
+        await db_writer.run(_stop_session, active_session["id"])
         
         return {"message": "Time tracking stopped"}
     
@@ -532,102 +3482,395 @@ async def stop_time_tracking(current_user: dict = Depends(get_current_user)):
         await send_error_notification(error_msg)
         raise HTTPException(status_code=500, detail="Failed to stop time tracking")
 
+def _stop_session(conn: sqlite3.Connection, session_id: int):
+    # Calculate duration and update; a concurrent stop of the same session is a no-op
+    stopped = conn.execute("""
+        UPDATE time_tracking 
+        SET end_time = CURRENT_TIMESTAMP,
+            duration_seconds = (strftime('%s', CURRENT_TIMESTAMP) - strftime('%s', start_time))
+        WHERE id = ? AND end_time IS NULL
+    """, (session_id,)).rowcount
+    if stopped:
+        add_session_to_rollup(conn, session_id)
+        add_session_to_buckets(conn, session_id)
+
+def _progress_rows(conn: sqlite3.Connection) -> List[dict]:
+    progress = conn.execute("""
+        SELECT 
+            u.first_name, u.last_name, u.email,
+            c.name as course_name,
+            p.total_seconds,
+            p.session_count
+        FROM progress_rollup p
+        JOIN users u ON u.id = p.user_id
+        JOIN courses c ON c.id = p.course_id
+        ORDER BY u.last_name, u.first_name, c.name
+    """).fetchall()
+    return [
+        {
+            "student_name": f"{p['first_name']} {p['last_name']}",
+            "email": p["email"],
+            "course_name": p["course_name"],
+            "total_seconds": p["total_seconds"] or 0,
+            "session_count": p["session_count"]
+        } for p in progress
+    ]
+
 @api_router.get("/progress")
-async def get_progress(admin: dict = Depends(get_current_admin)):
+async def get_progress(request: Request, response: Response, admin: dict = Depends(get_current_admin), db: AsyncConnection = Depends(get_db)):
     try:
-        conn = get_db_connection()
-        progress = conn.execute("""
-            SELECT 
-                u.first_name, u.last_name, u.email,
-                c.name as course_name,
-                SUM(t.duration_seconds) as total_seconds,
-                COUNT(t.id) as session_count
-            FROM users u
-            JOIN time_tracking t ON u.id = t.user_id
-            JOIN courses c ON t.course_id = c.id
-            WHERE t.duration_seconds IS NOT NULL
-            GROUP BY u.id, c.id
-            ORDER BY u.last_name, u.first_name, c.name
-        """).fetchall()
-        conn.close()
-        
-        return [
-            {
-                "student_name": f"{p['first_name']} {p['last_name']}",
-                "email": p["email"],
-                "course_name": p["course_name"],
-                "total_seconds": p["total_seconds"] or 0,
-                "session_count": p["session_count"]
-            } for p in progress
-        ]
+        unchanged = not_modified(request, response, await versioned_etag(request, db, ("progress_rollup", "users", "courses")))
+        if unchanged:
+            return unchanged
+        return await db.run(_progress_rows)
     
+    except HTTPException:
+        raise
     except Exception as e:
         error_msg = f"Get progress error: {str(e)}"
         await send_error_notification(error_msg)
         raise HTTPException(status_code=500, detail="Failed to fetch progress")
 
-@api_router.post("/upload-material")
-async def upload_material(
-    course_id: int = Form(...),
-    material_type: str = Form(...),
-    file: UploadFile = File(...),
+@api_router.post("/admin/progress/rebuild")
+async def rebuild_progress(admin: dict = Depends(get_current_admin), db: AsyncConnection = Depends(get_db)):
+    try:
+        rows = await db_writer.run(rebuild_progress_rollup, exclusive=True)
+        return {"message": "Progress rollup rebuilt", "rows": rows}
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        error_msg = f"Rebuild progress error: {str(e)}"
+        await send_error_notification(error_msg)
+        raise HTTPException(status_code=500, detail="Failed to rebuild progress")
+
+@api_router.get("/admin/progress/check")
+async def check_progress(admin: dict = Depends(get_current_admin), db: AsyncConnection = Depends(get_db)):
+    try:
+        mismatches = await db.run(check_progress_rollup)
+        return {"consistent": not mismatches, "mismatches": mismatches}
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        error_msg = f"Check progress error: {str(e)}"
+        await send_error_notification(error_msg)
+        raise HTTPException(status_code=500, detail="Failed to check progress")
+
+@api_router.get("/analytics/practice")
+async def get_practice_analytics(
+    granularity: str = "day",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    user_id: Optional[int] = None,
+    course_id: Optional[int] = None,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncConnection = Depends(get_db)
+):
+    try:
+        if granularity not in PRACTICE_BUCKET_EXPRESSIONS:
+            raise HTTPException(status_code=400, detail="granularity must be 'day' or 'week'")
+        
+        # Students only see their own practice; admins may see one or all students
+        if not current_user["is_admin"]:
+            if user_id is not None and user_id != current_user["id"]:
+                raise HTTPException(status_code=403, detail="Access denied")
+            user_id = current_user["id"]
+        
+        limit = PRACTICE_RANGE_LIMITS[granularity]
+        end = bucket_floor(end or datetime.utcnow().date(), granularity)
+        step = timedelta(weeks=1) if granularity == "week" else timedelta(days=1)
+        start = bucket_floor(start, granularity) if start else end - step * (PRACTICE_DEFAULT_RANGE[granularity] - 1)
+        if start > end:
+            raise HTTPException(status_code=400, detail="start must not be after end")
+        if (end - start) // step >= limit:
+            raise HTTPException(status_code=400, detail=f"Range is limited to {limit} {granularity}s")
+        
+        buckets = await db.run(_fetch_practice_buckets, granularity, start, end, user_id, course_id)
+        return {
+            "granularity": granularity,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "buckets": [dict(bucket) for bucket in buckets],
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        error_msg = f"Get practice analytics error: {str(e)}"
+        await send_error_notification(error_msg)
+        raise HTTPException(status_code=500, detail="Failed to fetch practice analytics")
+
+@api_router.post("/admin/practice/backfill")
+async def backfill_practice(admin: dict = Depends(get_current_admin), db: AsyncConnection = Depends(get_db)):
+    try:
+        rows = await db_writer.run(backfill_practice_buckets, exclusive=True)
+        return {"message": "Practice buckets rebuilt", "rows": rows}
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        error_msg = f"Backfill practice error: {str(e)}"
+        await send_error_notification(error_msg)
+        raise HTTPException(status_code=500, detail="Failed to backfill practice buckets")
+
+# Admin dashboard: the four datasets the dashboard shows, cached per section
+# and keyed by the versions of the tables each one reads. A section is rebuilt
+# only after a write to one of its tables, and a client passing back the
+# version it holds as ``since`` only receives the sections that changed. The
+# shared counters are re-read on every dashboard request rather than trusting
+# the TABLE_VERSIONS_MAX_AGE copy, so a write from another worker or the
+# maintenance commands is never served from the cache; that is one small
+# query, against rebuilding every section.
+DASHBOARD_SECTIONS = {
+    "students": ("users",),
+    "courses": ("courses",),
+    "progress": ("progress_rollup", "users", "courses"),
+    "assignments": ("user_courses", "users", "courses"),
+}
+DASHBOARD_TABLES = tuple(sorted({table for tables in DASHBOARD_SECTIONS.values() for table in tables}))
+dashboard_sections = {}  # section -> (version key, data)
+
+def _dashboard_students(conn: sqlite3.Connection) -> List[dict]:
+    return [dict(row) for row in conn.execute(
+        "SELECT id, first_name, last_name, email FROM users WHERE is_admin = 0 ORDER BY first_name, last_name, id"
+    )]
+
+def _dashboard_courses(conn: sqlite3.Connection) -> List[dict]:
+    return [dict(row) for row in conn.execute("SELECT id, name, description FROM courses ORDER BY id")]
+
+def _dashboard_assignments(conn: sqlite3.Connection) -> List[dict]:
+    return [
+        {
+            "user_id": row["user_id"],
+            "student_name": f"{row['first_name']} {row['last_name']}",
+            "email": row["email"],
+            "course_id": row["course_id"],
+            "course_name": row["course_name"],
+            "assigned_at": row["assigned_at"]
+        } for row in conn.execute("""
+            SELECT u.id as user_id, u.first_name, u.last_name, u.email,
+                   c.id as course_id, c.name as course_name, uc.assigned_at
+            FROM user_courses uc
+            JOIN users u ON uc.user_id = u.id
+            JOIN courses c ON uc.course_id = c.id
+            WHERE u.is_admin = FALSE
+            ORDER BY u.first_name, u.last_name, u.id, uc.course_id
+        """)
+    ]
+
+DASHBOARD_BUILDERS = {
+    "students": _dashboard_students,
+    "courses": _dashboard_courses,
+    "progress": _progress_rows,
+    "assignments": _dashboard_assignments,
+}
+
+def _build_dashboard_sections(conn: sqlite3.Connection, names: List[str]) -> dict:
+    """Build the requested sections from one consistent read transaction."""
+    conn.execute("BEGIN")
+    try:
+        return {name: DASHBOARD_BUILDERS[name](conn) for name in names}
+    finally:
+        conn.rollback()
+
+@api_router.get("/admin/dashboard")
+async def get_admin_dashboard(
+    request: Request,
+    response: Response,
+    since: Optional[str] = None,
+    admin: dict = Depends(get_current_admin),
+    db: AsyncConnection = Depends(get_db)
+):
+    """Students, courses, progress and assignments in one response"""
+    try:
+        unchanged = not_modified(request, response, await versioned_etag(request, db, DASHBOARD_TABLES, max_age=0))
+        if unchanged:
+            return unchanged
+        
+        client_versions = {}
+        if since:
+            with suppress(HTTPException):
+                versions, = decode_cursor(since, 1)
+                if isinstance(versions, dict):
+                    client_versions = versions
+        
+        # Read the versions before the data, so data is never older than its label
+        current = {name: table_versions.key(tables) for name, tables in DASHBOARD_SECTIONS.items()}
+        sections = {}
+        for name in DASHBOARD_SECTIONS:
+            cached = dashboard_sections.get(name)
+            if cached is not None and cached[0] == current[name]:
+                sections[name] = cached[1]
+        stale = [name for name in DASHBOARD_SECTIONS if name not in sections]
+        if stale:
+            built = await db.run(_build_dashboard_sections, stale)
+            for name in stale:
+                dashboard_sections[name] = (current[name], built[name])
+            sections.update(built)
+        
+        changed = [name for name in DASHBOARD_SECTIONS if client_versions.get(name) != current[name]]
+        return {
+            "version": encode_cursor([current]),
+            "sections": {name: sections[name] for name in changed},
+            "unchanged": [name for name in DASHBOARD_SECTIONS if name not in changed],
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        error_msg = f"Get dashboard error: {str(e)}"
+        await send_error_notification(error_msg)
+        raise HTTPException(status_code=500, detail="Failed to fetch dashboard")
+
+@api_router.get("/admin/export/{dataset}")
+async def export_dataset(
+    dataset: str,
+    format: str = "csv",
+    gzip: bool = False,
     admin: dict = Depends(get_current_admin)
 ):
+    """Stream sessions, assignments or progress as CSV or NDJSON"""
     try:
-        # Create uploads directory if it doesn't exist
-        upload_dir = "uploads"
-        os.makedirs(upload_dir, exist_ok=True)
-        
-        # Save file
-        file_path = f"{upload_dir}/{file.filename}"
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        
-        # Save to database
-        conn = get_db_connection()
-        conn.execute(
-            "INSERT INTO course_materials (course_id, material_type, filename, file_path) VALUES (?, ?, ?, ?)",
-            (course_id, material_type, file.filename, file_path)
+        if dataset not in EXPORT_DATASETS:
+            raise HTTPException(status_code=404, detail="Unknown export")
+        if format not in EXPORT_FORMATS:
+            raise HTTPException(status_code=400, detail="format must be 'csv' or 'ndjson'")
+        
+        # Read the first page before answering, so failures still get a proper status
+        stream = export_stream(dataset, format, gzip)
+        first_chunk = await anext(stream)
+        
+        async def body():
+            yield first_chunk
+            async for chunk in stream:
+                yield chunk
+        
+        filename = f"{dataset}-{datetime.utcnow():%Y%m%d-%H%M%S}.{format}" + (".gz" if gzip else "")
+        return StreamingResponse(
+            body(),
+            media_type="application/gzip" if gzip else EXPORT_FORMATS[format],
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
         )
-        conn.commit()
-        conn.close()
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        error_msg = f"Export error: {str(e)}"
+        await send_error_notification(error_msg)
+        raise HTTPException(status_code=500, detail="Failed to export data")
+
+class MaterialUploadForm(BaseModel):
+    course_id: int
+    material_type: str
+
+MATERIAL_UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["course_id", "material_type", "file"],
+            "properties": {
+                "course_id": {"type": "integer"},
+                "material_type": {"type": "string"},
+                "file": {"type": "string", "format": "binary"},
+            },
+        }}},
+    }
+}
+
+@api_router.post("/upload-material", openapi_extra=MATERIAL_UPLOAD_OPENAPI)
+async def upload_material(request: Request, admin: dict = Depends(get_current_admin), db: AsyncConnection = Depends(get_db)):
+    staged = None
+    try:
+        # The body is parsed here rather than by FastAPI's Form/File
+        # parameters so the file is written once, straight into UPLOAD_DIR
+        upload = await stage_multipart_upload(request, UPLOAD_DIR, MAX_UPLOAD_BYTES)
+        staged = upload.staged
+        try:
+            form = MaterialUploadForm(**upload.fields)
+        except ValidationError as e:
+            raise RequestValidationError([{**error, "loc": ("body", *error["loc"])} for error in e.errors()])
+        course_id, material_type = form.course_id, form.material_type
+        filename = safe_filename(upload.filename)
         
-        return {"message": "Material uploaded successfully"}
+        # Save to database, then publish the file; a failed insert leaves nothing behind
+        material = await db_writer.run(publish_material, course_id, material_type, filename, staged, exclusive=True)
+        size_bytes, sha256 = staged.size_bytes, staged.sha256
+        staged = None
+        
+        return {
+            "message": "Material uploaded successfully",
+            "id": material["id"],
+            "size_bytes": size_bytes,
+            "sha256": sha256,
+            "deduplicated": material["deduplicated"]
+        }
     
+    except (HTTPException, RequestValidationError):
+        raise
     except Exception as e:
         error_msg = f"Upload material error: {str(e)}"
         await send_error_notification(error_msg)
         raise HTTPException(status_code=500, detail="Failed to upload material")
+    finally:
+        if staged is not None:
+            discard_staged_file(staged.temp_path)
+
+@api_router.delete("/materials/{material_id}")
+async def remove_material(material_id: int, admin: dict = Depends(get_current_admin), db: AsyncConnection = Depends(get_db)):
+    try:
+        if not await db_writer.run(delete_material, material_id, exclusive=True):
+            raise HTTPException(status_code=404, detail="Material not found")
+        
+        return {"message": "Material deleted successfully"}
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        error_msg = f"Delete material error: {str(e)}"
+        await send_error_notification(error_msg)
+        raise HTTPException(status_code=500, detail="Failed to delete material")
 
 @api_router.get("/course-materials/{course_id}")
-async def get_course_materials(course_id: int, current_user: dict = Depends(get_current_user)):
+async def get_course_materials(course_id: int, request: Request, response: Response, current_user: dict = Depends(get_current_user), db: AsyncConnection = Depends(get_db)):
     try:
-        conn = get_db_connection()
+        # download_url changes with each signing window and token version, and access with user_courses
+        etag = await versioned_etag(
+            request, db, ("course_materials", "user_courses"),
+            current_user["id"], current_user["is_admin"], int(time.time()) // MATERIAL_URL_TTL_SECONDS,
+            token_revocations.current_version(current_user["id"])
+        )
+        unchanged = not_modified(request, response, etag)
+        if unchanged:
+            return unchanged
         
         # Check access
         if not current_user["is_admin"]:
-            assigned = conn.execute(
+            assigned = await read_flights.fetchone(
+                db, ("user_courses",),
                 "SELECT * FROM user_courses WHERE user_id = ? AND course_id = ?",
                 (current_user["id"], course_id)
-            ).fetchone()
+            )
             
             if not assigned:
-                conn.close()
                 raise HTTPException(status_code=403, detail="Course not assigned to user")
         
-        materials = conn.execute(
+        # Identical for every student of the course, so a class opening the
+        # page together shares one query
+        materials = await read_flights.fetchall(
+            db, ("course_materials",),
             "SELECT * FROM course_materials WHERE course_id = ?",
             (course_id,)
-        ).fetchall()
-        conn.close()
+        )
         
         return [
             {
                 "id": m["id"],
                 "material_type": m["material_type"],
                 "filename": m["filename"],
-                "file_path": m["file_path"]
+                "file_path": m["file_path"],
+                "download_url": material_download_url(m["id"], current_user)
             } for m in materials
         ]
     
@@ -638,13 +3881,86 @@ async def get_course_materials(course_id: int, current_user: dict = Depends(get_
         await send_error_notification(error_msg)
         raise HTTPException(status_code=500, detail="Failed to fetch course materials")
 
+@api_router.api_route("/materials/{material_id}/content", methods=["GET", "HEAD"])
+async def download_material(
+    material_id: int,
+    request: Request,
+    token: Optional[str] = None,
+    bearer_token: Optional[str] = Depends(optional_oauth2_scheme),
+    db: AsyncConnection = Depends(get_db)
+):
+    """Serve a material file with Range and conditional GET support.
+
+    Accepts either the signed ``token`` from ``download_url`` or a normal
+    bearer token; course access is checked on every request.
+    """
+    if token:
+        try:
+            claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            raise HTTPException(status_code=401, detail="Invalid or expired download link")
+        if claims.get("typ") != "material" or claims.get("mid") != material_id:
+            raise HTTPException(status_code=401, detail="Invalid or expired download link")
+        if claims.get("ver", 0) < token_revocations.current_version(claims["uid"]):
+            raise HTTPException(status_code=401, detail="Invalid or expired download link")
+        user_id = claims["uid"]
+    elif bearer_token:
+        user_id = (await get_current_user(bearer_token, db))["id"]
+    else:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    
+    # The role is read with the material rather than taken from the link, so
+    # a demoted or deleted user loses access as soon as the row changes
+    material = await db.fetchone("""
+        SELECT m.course_id, m.filename, m.file_path, m.sha256, u.is_admin,
+               EXISTS (SELECT 1 FROM user_courses uc WHERE uc.user_id = u.id AND uc.course_id = m.course_id) AS assigned
+        FROM users u
+        LEFT JOIN course_materials m ON m.id = ?
+        WHERE u.id = ?
+    """, (material_id, user_id))
+    if material is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired download link")
+    if material["file_path"] is None:
+        raise HTTPException(status_code=404, detail="Material not found")
+    if not material["is_admin"] and not material["assigned"]:
+        raise HTTPException(status_code=403, detail="Course not assigned to user")
+    
+    return material_file_response(request, material["file_path"], material["filename"], material["sha256"])
+
+ASSIGNMENT_FIELDS = ["user_id", "student_name", "email", "course_id", "course_name", "assigned_at"]
+ASSIGNMENT_KEY_FIELDS = ["first_name", "last_name", "user_id", "course_id"]
+
 @api_router.get("/student-assignments")
-async def get_student_assignments(admin: dict = Depends(get_current_admin)):
-    """Get all student-course assignments"""
+async def get_student_assignments(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    course_id: Optional[int] = None,
+    name: Optional[str] = None,
+    fields: Optional[str] = None,
+    admin: dict = Depends(get_current_admin),
+    db: AsyncConnection = Depends(get_db)
+):
+    """Get student-course assignments, one page at a time"""
     try:
-        conn = get_db_connection()
+        unchanged = not_modified(request, response, await versioned_etag(request, db, ("user_courses", "users", "courses")))
+        if unchanged:
+            return unchanged
+        
+        limit = check_page_limit(limit, cursor)
+        selected = parse_fields(fields, ASSIGNMENT_FIELDS)
+        after = decode_cursor(cursor, len(ASSIGNMENT_KEY_FIELDS)) if cursor else None
         
-        assignments = conn.execute("""
+        conditions, params = ["u.is_admin = FALSE"], []
+        if course_id is not None:
+            conditions.append("uc.course_id = ?")
+            params.append(course_id)
+        if name:
+            conditions.append("(u.first_name LIKE ? ESCAPE '\\' OR u.last_name LIKE ? ESCAPE '\\')")
+            params += [like_prefix(name)] * 2
+        
+        assignments, has_more = await db.run(_fetch_page, """
             SELECT 
                 u.id as user_id,
                 u.first_name,
@@ -656,22 +3972,21 @@ async def get_student_assignments(admin: dict = Depends(get_current_admin)):
             FROM user_courses uc
             JOIN users u ON uc.user_id = u.id
             JOIN courses c ON uc.course_id = c.id
-            WHERE u.is_admin = FALSE
-            ORDER BY u.first_name, u.last_name, c.name
-        """).fetchall()
+        """, conditions, params, ["u.first_name", "u.last_name", "u.id", "uc.course_id"], after, limit)
+        set_next_cursor(response, assignments, has_more, ASSIGNMENT_KEY_FIELDS)
         
-        conn.close()
-        
-        return [
-            {
+        rows = []
+        for assignment in assignments:
+            row = {
                 "user_id": assignment["user_id"],
                 "student_name": f"{assignment['first_name']} {assignment['last_name']}",
                 "email": assignment["email"],
                 "course_id": assignment["course_id"],
                 "course_name": assignment["course_name"],
                 "assigned_at": assignment["assigned_at"]
-            } for assignment in assignments
-        ]
+            }
+            rows.append({field: row[field] for field in selected})
+        return rows
     
     except HTTPException:
         raise
@@ -700,7 +4015,7 @@ async def serve_react_app(path: str):
 # Error handler
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
-    error_msg = f"Global error in {request.url}: {str(exc)}"
+    error_msg = f"Global error in {redact_url_tokens(str(request.url))}: {str(exc)}"
     await send_error_notification(error_msg)
     logger.error(error_msg)
     return JSONResponse(
@@ -711,6 +4026,37 @@ async def global_exception_handler(request, exc):
 # Export app for Vercel
 handler = app
 
+# Maintenance commands: python main.py <command>
+def _run_rebuild_progress(conn: sqlite3.Connection):
+    print(f"progress_rollup rebuilt: {rebuild_progress_rollup(conn)} rows")
+
+def _run_check_progress(conn: sqlite3.Connection):
+    mismatches = check_progress_rollup(conn)
+    for mismatch in mismatches:
+        print(json.dumps(mismatch))
+    print("progress_rollup is consistent" if not mismatches else f"{len(mismatches)} mismatched rows")
+    return 1 if mismatches else 0
+
+def _run_backfill_practice(conn: sqlite3.Connection):
+    print(f"practice_buckets rebuilt: {backfill_practice_buckets(conn)} rows")
+
+MAINTENANCE_COMMANDS = {
+    "rebuild-progress": _run_rebuild_progress,
+    "check-progress": _run_check_progress,
+    "backfill-practice": _run_backfill_practice,
+}
+
+startup_report["import_seconds"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+
 if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 1:
+        command = MAINTENANCE_COMMANDS.get(sys.argv[1])
+        if command is None:
+            sys.exit(f"Unknown command {sys.argv[1]!r}; expected one of: {', '.join(MAINTENANCE_COMMANDS)}")
+        init_db()
+        with db_pool.connection() as conn:
+            sys.exit(command(conn) or 0)
+    
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
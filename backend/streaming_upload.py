@@ -0,0 +1,224 @@
+"""Streaming multipart uploads, shared by backend/main.py and api/index.py.
+
+Starlette's form parser spools every file part to a temporary file before
+the handler runs, so handlers that then staged the upload next to its
+destination wrote each file twice. ``stage_multipart_upload`` parses the
+request body as it arrives instead and writes the file part once, hashing
+it on the way, into a temporary file in its destination directory so it
+can be moved into place with an atomic ``os.replace``.
+"""
+import hashlib
+import os
+import tempfile
+from typing import Dict, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from multipart.multipart import MultipartParser, parse_options_header
+from pydantic import BaseModel
+
+MAX_FIELD_BYTES = 64 * 1024  # non-file form fields are small values such as ids
+
+
+class UploadTooLargeError(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=413, detail="File is too large")
+
+
+class UploadSizeLimitMiddleware:
+    """Cap the request body size of upload endpoints.
+
+    A declared Content-Length over the limit is refused before the body is
+    read. Chunked bodies have no Content-Length, so ``receive`` is wrapped
+    and the request is failed with 413 as soon as the bytes received pass
+    the limit.
+    """
+
+    def __init__(self, app, paths, max_bytes: int):
+        self.app = app
+        self.paths = set(paths)
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > self.max_bytes:
+                await self._reject(scope, receive, send)
+                return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise UploadTooLargeError()
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except UploadTooLargeError:
+            # Handlers normally turn this into a 413 themselves; this covers
+            # body reads that happen outside a handler's error handling.
+            if response_started:
+                raise
+            await self._reject(scope, receive, send)
+
+    @staticmethod
+    async def _reject(scope, receive, send):
+        response = JSONResponse(status_code=413, content={"detail": "File is too large"})
+        await response(scope, receive, send)
+
+
+class StagedUpload(BaseModel):
+    temp_path: str
+    size_bytes: int
+    sha256: str
+
+
+class MultipartUpload(BaseModel):
+    fields: Dict[str, str]
+    filename: str
+    staged: StagedUpload
+
+
+def discard_staged_file(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+async def stage_multipart_upload(request: Request, directory: str, max_bytes: int, file_field: str = "file") -> MultipartUpload:
+    """Parse a multipart/form-data body, streaming ``file_field`` to disk.
+
+    The file part goes straight to a temporary file in ``directory``; callers
+    must move it into place or delete it. Other parts are returned as text
+    fields. Raises UploadTooLargeError once the file passes ``max_bytes``
+    and a 400 for bodies that are not a single-file multipart form.
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    boundary = options.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data body")
+
+    # Parser callbacks run synchronously inside parser.write(); they only
+    # record events, which are applied (with file writes off the event
+    # loop) after each received chunk.
+    events = []
+    headers = {}
+    header_field = bytearray()
+    header_value = bytearray()
+
+    def on_part_begin():
+        headers.clear()
+
+    def on_header_field(data, start, end):
+        header_field.extend(data[start:end])
+
+    def on_header_value(data, start, end):
+        header_value.extend(data[start:end])
+
+    def on_header_end():
+        headers[bytes(header_field).lower()] = bytes(header_value)
+        header_field.clear()
+        header_value.clear()
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(headers.get(b"content-disposition", b""))
+        name = disposition.get(b"name", b"").decode("utf-8", "replace")
+        filename = disposition.get(b"filename")
+        events.append(("part", name, None if filename is None else filename.decode("utf-8", "replace")))
+
+    def on_part_data(data, start, end):
+        events.append(("data", data[start:end]))
+
+    def on_part_end():
+        events.append(("end",))
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    fields = {}
+    filename: Optional[str] = None
+    out = None
+    temp_path = None
+    digest = hashlib.sha256()
+    size = 0
+    part_name = None
+    in_file = False
+    field_value = bytearray()
+
+    try:
+        async for chunk in request.stream():
+            try:
+                parser.write(chunk)
+            except Exception:
+                raise HTTPException(status_code=400, detail="Malformed multipart body")
+
+            pending = bytearray()
+            for event in events:
+                if event[0] == "part":
+                    _, part_name, part_filename = event
+                    in_file = part_name == file_field and part_filename is not None
+                    if in_file:
+                        if out is not None:
+                            raise HTTPException(status_code=400, detail="Only one file can be uploaded")
+                        os.makedirs(directory, exist_ok=True)
+                        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".upload-", suffix=".part")
+                        out = os.fdopen(fd, "wb")
+                        filename = part_filename
+                    field_value.clear()
+                elif event[0] == "data":
+                    data = event[1]
+                    if in_file:
+                        size += len(data)
+                        if size > max_bytes:
+                            raise UploadTooLargeError()
+                        digest.update(data)
+                        pending.extend(data)
+                    else:
+                        field_value.extend(data)
+                        if len(field_value) > MAX_FIELD_BYTES:
+                            raise HTTPException(status_code=400, detail="Form field is too large")
+                elif not in_file and part_name:
+                    fields[part_name] = field_value.decode("utf-8", "replace")
+            events.clear()
+            if pending:
+                await run_in_threadpool(out.write, bytes(pending))
+
+        parser.finalize()
+        if out is None:
+            raise HTTPException(status_code=400, detail="No file uploaded")
+        out.close()
+    except BaseException:
+        if out is not None:
+            out.close()
+            discard_staged_file(temp_path)
+        raise
+
+    return MultipartUpload(
+        fields=fields,
+        filename=filename,
+        staged=StagedUpload(temp_path=temp_path, size_bytes=size, sha256=digest.hexdigest()),
+    )
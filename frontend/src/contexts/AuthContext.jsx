@@ -97,6 +97,10 @@ export const AuthProvider = ({ children }) => {
   };
 
   const logout = () => {
+    if (token) {
+      // Best effort: revoke the token server-side, but never block logging out
+      axios.post(`${API_BASE_URL}/logout`).catch(() => {});
+    }
     localStorage.removeItem('token');
     setToken(null);
     setUser(null);
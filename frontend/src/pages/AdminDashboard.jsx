@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 import { 
   Users, 
@@ -22,6 +22,9 @@ const AdminDashboard = () => {
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
   const [activeTab, setActiveTab] = useState('students');
+  const [selectedStudents, setSelectedStudents] = useState([]);
+  const [bulkCourseId, setBulkCourseId] = useState('');
+  const dashboardVersion = useRef(null);
   const [uploadData, setUploadData] = useState({
     courseId: '',
     materialType: 'lyrics',
@@ -34,17 +37,17 @@ const AdminDashboard = () => {
 
   const fetchData = async () => {
     try {
-      const [studentsRes, coursesRes, progressRes, assignmentsRes] = await Promise.all([
-        axios.get(`${API_BASE_URL}/students`),
-        axios.get(`${API_BASE_URL}/courses`),
-        axios.get(`${API_BASE_URL}/progress`),
-        axios.get(`${API_BASE_URL}/student-assignments`)
-      ]);
+      // Only sections that changed since the version we hold are sent back
+      const res = await axios.get(`${API_BASE_URL}/admin/dashboard`, {
+        params: dashboardVersion.current ? { since: dashboardVersion.current } : {}
+      });
+      const { sections } = res.data;
 
-      setStudents(studentsRes.data);
-      setCourses(coursesRes.data);
-      setProgress(progressRes.data);
-      setAssignments(assignmentsRes.data);
+      if (sections.students) setStudents(sections.students);
+      if (sections.courses) setCourses(sections.courses);
+      if (sections.progress) setProgress(sections.progress);
+      if (sections.assignments) setAssignments(sections.assignments);
+      dashboardVersion.current = res.data.version;
     } catch (err) {
       setError('Failed to fetch data');
       console.error('Error fetching data:', err);
@@ -77,6 +80,34 @@ const AdminDashboard = () => {
     }
   };
 
+  const toggleStudent = (studentId) => {
+    setSelectedStudents(selected =>
+      selected.includes(studentId)
+        ? selected.filter(id => id !== studentId)
+        : [...selected, studentId]
+    );
+  };
+
+  const bulkUpdateCourse = async (action) => {
+    if (!bulkCourseId || selectedStudents.length === 0) {
+      alert('Please select students and a course');
+      return;
+    }
+    try {
+      const res = await axios.post(`${API_BASE_URL}/${action}-courses`, {
+        assignments: selectedStudents.map(userId => ({ user_id: userId, course_id: parseInt(bulkCourseId) }))
+      });
+      const summary = Object.entries(res.data.summary)
+        .map(([status, count]) => `${count} ${status.replace('_', ' ')}`)
+        .join(', ');
+      alert(`Done: ${summary}`);
+      setSelectedStudents([]);
+      fetchData(); // Refresh data
+    } catch (err) {
+      alert(`Failed to ${action} course: ` + (err.response?.data?.detail || 'Unknown error'));
+    }
+  };
+
   const handleFileUpload = async (e) => {
     e.preventDefault();
     
@@ -209,9 +240,48 @@ const AdminDashboard = () => {
                   </div>
                 ) : (
                   <div className="overflow-x-auto">
+                    <div className="flex items-center space-x-2 mb-4">
+                      <span className="text-sm text-gray-600">{selectedStudents.length} selected</span>
+                      <select
+                        value={bulkCourseId}
+                        onChange={(e) => setBulkCourseId(e.target.value)}
+                        className="border border-gray-300 rounded px-3 py-1 text-sm"
+                      >
+                        <option value="">Choose Course</option>
+                        {courses.map((course) => (
+                          <option key={course.id} value={course.id}>
+                            {course.name}
+                          </option>
+                        ))}
+                      </select>
+                      <button
+                        onClick={() => bulkUpdateCourse('assign')}
+                        className="flex items-center text-white px-3 py-1 rounded text-sm hover:bg-opacity-80 transition-colors duration-200"
+                        style={{ backgroundColor: '#7e5a40' }}
+                      >
+                        <UserPlus className="mr-1" size={14} />
+                        Assign Selected
+                      </button>
+                      <button
+                        onClick={() => bulkUpdateCourse('unassign')}
+                        className="flex items-center text-white px-3 py-1 rounded text-sm hover:bg-opacity-80 transition-colors duration-200"
+                        style={{ backgroundColor: '#7e5a40' }}
+                      >
+                        <UserMinus className="mr-1" size={14} />
+                        Remove Selected
+                      </button>
+                    </div>
                     <table className="min-w-full divide-y divide-gray-200">
                       <thead className="bg-gray-50">
                         <tr>
+                          <th className="px-6 py-3 text-left">
+                            <input
+                              type="checkbox"
+                              checked={students.length > 0 && selectedStudents.length === students.length}
+                              disabled={students.length === 0}
+                              onChange={(e) => setSelectedStudents(e.target.checked ? students.map(s => s.id) : [])}
+                            />
+                          </th>
                           <th className="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">
                             Student & Current Assignments
                           </th>
@@ -232,6 +302,13 @@ const AdminDashboard = () => {
                           
                           return (
                             <tr key={student.id}>
+                              <td className="px-6 py-4 whitespace-nowrap">
+                                <input
+                                  type="checkbox"
+                                  checked={selectedStudents.includes(student.id)}
+                                  onChange={() => toggleStudent(student.id)}
+                                />
+                              </td>
                               <td className="px-6 py-4 whitespace-nowrap">
                                 <div className="text-sm font-medium text-gray-900">
                                   {student.first_name} {student.last_name}
@@ -4,6 +4,7 @@ import axios from 'axios';
 import { Play, Pause, FileText, Music, Clock, Upload } from 'lucide-react';
 
 const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || '/api';
+const HEARTBEAT_INTERVAL_MS = 30000;
 
 const CoursePage = () => {
   const { courseId } = useParams();
@@ -16,14 +17,25 @@ const CoursePage = () => {
 
   useEffect(() => {
     fetchCourseData();
-    startTimeTracking();
-    
+    setIsTimerActive(true);
+  }, [courseId]);
+
+  // While the timer runs, ping the server; the final ping ends the session
+  useEffect(() => {
+    if (!isTimerActive) {
+      return undefined;
+    }
+    sendHeartbeat();
+    const heartbeat = setInterval(() => sendHeartbeat(), HEARTBEAT_INTERVAL_MS);
+    const endSession = () => sendHeartbeat(true);
+    window.addEventListener('pagehide', endSession);
+
     return () => {
-      if (isTimerActive) {
-        stopTimeTracking();
-      }
+      clearInterval(heartbeat);
+      window.removeEventListener('pagehide', endSession);
+      endSession();
     };
-  }, [courseId]);
+  }, [isTimerActive, courseId]);
 
   useEffect(() => {
     let interval = null;
@@ -64,32 +76,27 @@ const CoursePage = () => {
     }
   };
 
-  const startTimeTracking = async () => {
+  const sendHeartbeat = async (final = false) => {
     try {
-      await axios.post(`${API_BASE_URL}/time-tracking/start`, null, {
-        params: { course_id: courseId }
-      });
-      setIsTimerActive(true);
-    } catch (err) {
-      console.error('Error starting time tracking:', err);
-    }
-  };
-
-  const stopTimeTracking = async () => {
-    try {
-      await axios.post(`${API_BASE_URL}/time-tracking/stop`);
-      setIsTimerActive(false);
+      if (final) {
+        // keepalive lets the last ping outlive a closing tab
+        await fetch(`${API_BASE_URL}/time-tracking/heartbeat?course_id=${courseId}&final=true`, {
+          method: 'POST',
+          keepalive: true,
+          headers: { Authorization: axios.defaults.headers.common['Authorization'] || '' }
+        });
+      } else {
+        await axios.post(`${API_BASE_URL}/time-tracking/heartbeat`, null, {
+          params: { course_id: courseId }
+        });
+      }
     } catch (err) {
-      console.error('Error stopping time tracking:', err);
+      console.error('Error sending heartbeat:', err);
     }
   };
 
   const toggleTimer = () => {
-    if (isTimerActive) {
-      stopTimeTracking();
-    } else {
-      startTimeTracking();
-    }
+    setIsTimerActive(active => !active);
   };
 
   const formatTime = (seconds) => {
@@ -224,7 +231,7 @@ const CoursePage = () => {
                       {material.filename}
                     </h3>
                     <a
-                      href={`/api/${material.file_path}`}
+                      href={material.download_url}
                       target="_blank"
                       rel="noopener noreferrer"
                       className="inline-flex items-center text-white px-4 py-2 rounded-lg hover:bg-opacity-80 transition-colors duration-200"
@@ -261,12 +268,12 @@ const CoursePage = () => {
                     <audio
                       controls
                       className="w-full mb-3"
-                      src={`/api/${material.file_path}`}
+                      src={material.download_url}
                     >
                       Your browser does not support the audio element.
                     </audio>
                     <a
-                      href={`/api/${material.file_path}`}
+                      href={material.download_url}
                       download
                       className="inline-flex items-center text-white px-4 py-2 rounded-lg hover:bg-opacity-80 transition-colors duration-200"
                       style={{ backgroundColor: '#7e5a40' }}
@@ -0,0 +1,65 @@
+"""Requests keep being served while a long query occupies a database thread."""
+import asyncio
+import importlib
+import os
+import sys
+import time
+
+import httpx
+import pytest
+
+BACKEND = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+
+SLOW_QUERY_SECONDS = 1.5
+CONCURRENT_REQUESTS = 20
+
+@pytest.fixture(scope="module")
+def main(tmp_path_factory):
+    workdir = tmp_path_factory.mktemp("async-db")
+    os.environ["DATABASE_PATH"] = str(workdir / "test.db")
+    os.environ["PASSWORD_HASH_ROUNDS"] = "4"
+    sys.path.insert(0, BACKEND)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        module = importlib.import_module("main")
+        module.init_db()
+        yield module
+    finally:
+        module.db_writer.shutdown()
+        module.password_hasher.shutdown()
+        os.chdir(cwd)
+        sys.path.remove(BACKEND)
+
+def _slow_query(conn, seconds):
+    # Stands in for a long scan: holds a pooled connection and an executor thread
+    conn.execute("SELECT COUNT(*) FROM users").fetchone()
+    time.sleep(seconds)
+    return time.perf_counter()
+
+def test_requests_progress_while_a_long_query_runs(main):
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            login = await client.post("/api/login", json={"email": "jayab2021@gmail.com", "password": "Admin@123"})
+            assert login.status_code == 200
+            headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+            
+            slow_db = main.AsyncConnection(main.db_pool, main.db_executor)
+            slow = asyncio.create_task(slow_db.run(_slow_query, SLOW_QUERY_SECONDS))
+            await asyncio.sleep(0.05)  # let the slow query start
+            
+            async def timed_get():
+                response = await client.get("/api/courses", headers=headers)
+                return response.status_code, time.perf_counter()
+            
+            results = await asyncio.gather(*(timed_get() for _ in range(CONCURRENT_REQUESTS)))
+            slow_done = not slow.done()
+            slow_finished_at = await slow
+            slow_db.release()
+            return results, slow_done, slow_finished_at
+    
+    results, slow_still_running, slow_finished_at = asyncio.run(scenario())
+    assert [status for status, _ in results] == [200] * CONCURRENT_REQUESTS
+    assert slow_still_running
+    assert all(finished_at < slow_finished_at for _, finished_at in results)
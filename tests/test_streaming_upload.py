@@ -0,0 +1,90 @@
+"""Uploads are streamed once to disk, and oversized bodies get a 413 however they are sent."""
+import asyncio
+import hashlib
+import os
+import sys
+
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+
+BACKEND = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+sys.path.insert(0, BACKEND)
+from streaming_upload import UploadSizeLimitMiddleware, stage_multipart_upload  # noqa: E402
+sys.path.remove(BACKEND)
+
+MAX_BYTES = 256 * 1024
+BOUNDARY = "test-boundary"
+
+@pytest.fixture
+def upload_dir(tmp_path):
+    return tmp_path / "uploads"
+
+@pytest.fixture
+def app(upload_dir):
+    app = FastAPI()
+    app.add_middleware(UploadSizeLimitMiddleware, paths=["/upload"], max_bytes=MAX_BYTES + 1024)
+
+    @app.post("/upload")
+    async def upload(request: Request):
+        upload = await stage_multipart_upload(request, str(upload_dir), MAX_BYTES)
+        return {"fields": upload.fields, "filename": upload.filename, **upload.staged.model_dump()}
+
+    return app
+
+def _multipart(payload: bytes, **fields) -> bytes:
+    body = b""
+    for name, value in fields.items():
+        body += f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+    body += f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="notes.pdf"\r\n'.encode()
+    body += b"Content-Type: application/pdf\r\n\r\n" + payload + f"\r\n--{BOUNDARY}--\r\n".encode()
+    return body
+
+def _post(app, body: bytes, chunked: bool):
+    async def pieces():
+        for start in range(0, len(body), 7919):
+            yield body[start:start + 7919]
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post(
+                "/upload",
+                content=pieces() if chunked else body,
+                headers={"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"},
+            )
+
+    return asyncio.run(scenario())
+
+@pytest.mark.parametrize("chunked", [False, True])
+def test_file_is_staged_in_destination_with_fields(app, upload_dir, chunked):
+    payload = os.urandom(100 * 1024)
+    response = _post(app, _multipart(payload, course_id="7", material_type="notes"), chunked)
+    assert response.status_code == 200
+    result = response.json()
+    assert result["fields"] == {"course_id": "7", "material_type": "notes"}
+    assert result["filename"] == "notes.pdf"
+    assert result["size_bytes"] == len(payload)
+    assert result["sha256"] == hashlib.sha256(payload).hexdigest()
+    assert os.path.dirname(result["temp_path"]) == str(upload_dir)
+    with open(result["temp_path"], "rb") as staged:
+        assert staged.read() == payload
+
+@pytest.mark.parametrize("chunked", [False, True])
+def test_oversized_upload_is_rejected_and_cleaned_up(app, upload_dir, chunked):
+    response = _post(app, _multipart(os.urandom(MAX_BYTES * 2)), chunked)
+    assert response.status_code == 413
+    assert not upload_dir.exists() or not any(upload_dir.iterdir())
+
+def test_chunked_body_over_the_middleware_limit_is_rejected(upload_dir):
+    # A handler that never reads the body through the staging helper still
+    # cannot be made to accept more than the middleware limit
+    app = FastAPI()
+    app.add_middleware(UploadSizeLimitMiddleware, paths=["/upload"], max_bytes=MAX_BYTES)
+
+    @app.post("/upload")
+    async def upload(request: Request):
+        return {"size": len(await request.body())}
+
+    response = _post(app, os.urandom(MAX_BYTES * 2), chunked=True)
+    assert response.status_code == 413